@@ -0,0 +1,69 @@
+import sys
+import json
+import subprocess
+
+# these take seconds to import and should only be loaded when a model is
+HEAVY_MODULES = ("torch", "transformers", "layoutparser", "detectron2", "colpali_engine", "chonkie",
+                 "sentence_transformers")
+
+# seconds, importing any of these should not pull in the heavy modules
+IMPORT_BUDGETS = {
+    "mnemosyne.literature.literature": 1.0,
+    "mnemosyne.literature.paper_processor": 1.0,
+    "mnemosyne.knowledgebase.knowledgebase": 1.0,
+    "mnemosyne.project.project": 1.0,
+}
+
+_SCRIPT = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "heavy": [name for name in {heavy} if name in sys.modules]}}))
+"""
+
+
+def import_time(module, repeat=3):
+    """
+    time the import of a module in a fresh interpreter, the best of repeat runs
+    :return: dict with the time in seconds and the heavy modules that were imported along with it
+    """
+    best = None
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-c", _SCRIPT.format(module=module, heavy=list(HEAVY_MODULES))],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            return {"seconds": None, "heavy": [], "error": result.stderr.strip().splitlines()[-1]}
+        run = json.loads(result.stdout.strip().splitlines()[-1])
+        if best is None or run["seconds"] < best["seconds"]:
+            best = run
+    return best
+
+
+def benchmark_imports(budgets=None, repeat=3):
+    """
+    import time regression check, each module has to import within its budget without importing any of the heavy
+    modules
+    :param budgets: dict of module: seconds, defaults to IMPORT_BUDGETS
+    :param repeat: runs per module, the best one is used
+    :return: dict of module: {"seconds", "heavy", "ok"} and "error" if the import failed
+    """
+    if budgets is None:
+        budgets = IMPORT_BUDGETS
+    results = {}
+    for module, budget in budgets.items():
+        result = import_time(module, repeat=repeat)
+        result["ok"] = result["seconds"] is not None and result["seconds"] <= budget and len(result["heavy"]) == 0
+        results[module] = result
+    return results
+
+
+if __name__ == "__main__":
+    results = benchmark_imports()
+    for module, result in results.items():
+        if "error" in result:
+            print("{}: failed to import, {}".format(module, result["error"]))
+        else:
+            print("{}: {:.3f}s {}{}".format(module, result["seconds"], "ok" if result["ok"] else "too slow",
+                                            ", imports " + ", ".join(result["heavy"]) if result["heavy"] else ""))
+    sys.exit(0 if all(result["ok"] for result in results.values()) else 1)
@@ -0,0 +1,245 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def content_hash(content):
+    """
+    sha256 of a piece of content, text, bytes, pillow images and numpy arrays are supported
+    """
+    sha = hashlib.sha256()
+    if isinstance(content, str):
+        sha.update(content.encode())
+    elif isinstance(content, (bytes, bytearray)):
+        sha.update(content)
+    elif isinstance(content, np.ndarray):
+        sha.update("{}:{}".format(content.dtype, content.shape).encode())
+        sha.update(np.ascontiguousarray(content).tobytes())
+    elif hasattr(content, "mode") and hasattr(content, "tobytes"):
+        # pillow image, the mode and size are part of the hash since the raw bytes do not have them
+        sha.update("{}:{}".format(content.mode, content.size).encode())
+        sha.update(content.tobytes())
+    else:
+        raise TypeError("Cannot hash content of type {}".format(type(content)))
+    return sha.hexdigest()
+
+
+def artifact_key(kind, model, digest):
+    """
+    key of a cached artifact, the kind of artifact (text_embedding, image_embedding, interpretation...), the model and
+    the settings it was computed with and the hash of the input
+    """
+    return hashlib.sha256(json.dumps([kind, model, digest], sort_keys=True, default=str).encode()).hexdigest()
+
+
+class ArtifactCache:
+    """
+    persistent cache for the outputs of the paper processing steps, keyed by the hash of the input (pdf, chunk text,
+    figure crop) and the model and settings used, so changing the model or the config computes things again.
+    Arrays are written as .npy files, one per call, and read back memory mapped, text outputs are kept in the sqlite
+    index. The least recently used entries are evicted when the cache is larger than max_size, a file is deleted once
+    none of its rows are in the index anymore. Nothing is created on disk until the first write.
+    """
+    def __init__(self, path, max_size=10 * 1024 ** 3, max_open_files=64):
+        """
+        :param path: directory for the cache, created on the first write if it does not exist
+        :param max_size: size cap in bytes for the stored arrays and texts
+        :param max_open_files: number of memory mapped files kept open
+        """
+        self.path = os.path.abspath(path)
+        self.max_size = max_size
+        self.max_open_files = max_open_files
+        self.hits = {}
+        self.misses = {}
+
+        self._files = OrderedDict()
+        self._lock = threading.Lock()
+        self.conn = None
+
+    def _connect(self, create=False):
+        """
+        open the index, if it does not exist it is only created when create is True so reading from a cache that was
+        never written to does not touch the disk
+        :return: True if the index is open
+        """
+        if self.conn is not None:
+            return True
+        index = os.path.join(self.path, "index.sqlite")
+        if not create and not os.path.exists(index):
+            return False
+        os.makedirs(os.path.join(self.path, "arrays"), exist_ok=True)
+        self.conn = sqlite3.connect(index, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS artifacts (
+                                key TEXT PRIMARY KEY,
+                                kind TEXT NOT NULL,
+                                file TEXT,
+                                row INTEGER,
+                                body TEXT,
+                                size INTEGER NOT NULL,
+                                created REAL NOT NULL,
+                                accessed REAL NOT NULL)""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ix_artifacts_accessed ON artifacts (accessed)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ix_artifacts_file ON artifacts (file)")
+        self.conn.commit()
+        return True
+
+    def _count(self, kind, hits, misses):
+        self.hits[kind] = self.hits.get(kind, 0) + hits
+        self.misses[kind] = self.misses.get(kind, 0) + misses
+
+    def _open(self, name):
+        if name in self._files:
+            self._files.move_to_end(name)
+            return self._files[name]
+        array = np.load(os.path.join(self.path, "arrays", name), mmap_mode="r")
+        self._files[name] = array
+        if len(self._files) > self.max_open_files:
+            self._files.popitem(last=False)
+        return array
+
+    def _lookup(self, kind, model, digests, column):
+        keys = [artifact_key(kind, model, digest) for digest in digests]
+        if not self._connect():
+            self._count(kind, 0, len(keys))
+            return [None] * len(keys)
+        rows = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            query = "SELECT key, {} FROM artifacts WHERE key IN ({})".format(column, ",".join("?" * len(chunk)))
+            for row in self.conn.execute(query, chunk).fetchall():
+                rows[row[0]] = row[1:]
+        now = time.time()
+        self.conn.executemany("UPDATE artifacts SET accessed=? WHERE key=?", [(now, key) for key in rows])
+        self.conn.commit()
+        self._count(kind, len([key for key in keys if key in rows]), len([key for key in keys if key not in rows]))
+        return [rows.get(key) for key in keys]
+
+    def get_arrays(self, kind, model, digests):
+        """
+        :param kind: kind of artifact
+        :param model: model name and settings, anything json serializable
+        :param digests: content hashes of the inputs
+        :return: list with a read only memory mapped array for each digest or None if it is not in the cache
+        """
+        with self._lock:
+            results = []
+            for row in self._lookup(kind, model, digests, "file, row"):
+                if row is None:
+                    results.append(None)
+                    continue
+                try:
+                    results.append(self._open(row[0])[row[1]])
+                except FileNotFoundError:
+                    results.append(None)
+            return results
+
+    def set_arrays(self, kind, model, digests, array):
+        """
+        store the rows of array, row i is the output for digests[i]
+        """
+        if len(digests) == 0:
+            return None
+        array = np.ascontiguousarray(array)
+        name = "{}.npy".format(uuid.uuid4().hex)
+        with self._lock:
+            self._connect(create=True)
+        with open(os.path.join(self.path, "arrays", name + ".tmp"), "wb") as f:
+            np.save(f, array)
+        os.replace(os.path.join(self.path, "arrays", name + ".tmp"), os.path.join(self.path, "arrays", name))
+        row_size = array.nbytes // max(len(array), 1)
+        now = time.time()
+        with self._lock:
+            self.conn.executemany("INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, NULL, ?, ?, ?)",
+                                  [(artifact_key(kind, model, digest), kind, name, row, row_size, now, now)
+                                   for row, digest in enumerate(digests)])
+            self.conn.commit()
+            self._evict()
+        return None
+
+    def get_texts(self, kind, model, digests):
+        """
+        :return: list with the stored text for each digest or None if it is not in the cache
+        """
+        with self._lock:
+            return [row[0] if row is not None else None for row in self._lookup(kind, model, digests, "body")]
+
+    def set_texts(self, kind, model, digests, texts):
+        now = time.time()
+        with self._lock:
+            self._connect(create=True)
+            self.conn.executemany("INSERT OR REPLACE INTO artifacts VALUES (?, ?, NULL, NULL, ?, ?, ?, ?)",
+                                  [(artifact_key(kind, model, digest), kind, text, len(text.encode()), now, now)
+                                   for digest, text in zip(digests, texts)])
+            self.conn.commit()
+            self._evict()
+        return None
+
+    def _remove_orphans(self, files):
+        for name in files:
+            if self.conn.execute("SELECT 1 FROM artifacts WHERE file=? LIMIT 1", (name,)).fetchone() is None:
+                self._files.pop(name, None)
+                try:
+                    os.remove(os.path.join(self.path, "arrays", name))
+                except FileNotFoundError:
+                    pass
+        return None
+
+    def _evict(self):
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM artifacts").fetchone()[0]
+        if total <= self.max_size:
+            return None
+        removed = []
+        files = set()
+        for key, name, size in self.conn.execute("SELECT key, file, size FROM artifacts ORDER BY accessed").fetchall():
+            if total <= self.max_size:
+                break
+            removed.append((key,))
+            if name is not None:
+                files.add(name)
+            total -= size
+        self.conn.executemany("DELETE FROM artifacts WHERE key=?", removed)
+        self.conn.commit()
+        self._remove_orphans(files)
+        return None
+
+    def clear(self):
+        with self._lock:
+            if not self._connect():
+                return None
+            files = [row[0] for row in self.conn.execute("SELECT DISTINCT file FROM artifacts WHERE file IS NOT NULL")]
+            self.conn.execute("DELETE FROM artifacts")
+            self.conn.commit()
+            self._remove_orphans(files)
+        return None
+
+    def stats(self):
+        """
+        :return: dict with the number of entries, their size in bytes and the hits, misses and hit rate per kind
+        """
+        with self._lock:
+            if self._connect():
+                entries, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM artifacts").fetchone()
+            else:
+                entries, size = 0, 0
+        kinds = {}
+        for kind in set(self.hits) | set(self.misses):
+            hits, misses = self.hits.get(kind, 0), self.misses.get(kind, 0)
+            kinds[kind] = {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses) if hits + misses else 0}
+        return {"entries": entries, "size": size, "kinds": kinds}
+
+    def close(self):
+        self._files.clear()
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def __repr__(self):
+        return "ArtifactCache(path={})".format(self.path)
@@ -0,0 +1,173 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from urllib.parse import urlparse, parse_qsl
+
+# credentials do not change the response so they are not part of the cache key
+IGNORED_PARAMS = ("api_key", "email", "mailto", "tool")
+
+# seconds, search results change as new papers are added, abstracts and openalex records much less so
+DEFAULT_TTL = {
+    "esearch": 24 * 3600,
+    "efetch": 30 * 24 * 3600,
+    "openalex": 7 * 24 * 3600,
+    "arxiv": 7 * 24 * 3600,
+}
+
+
+class CacheMissError(Exception):
+    pass
+
+
+def endpoint(url):
+    """
+    name of the endpoint a url belongs to, this is what the ttls are keyed by
+    """
+    parsed = urlparse(url)
+    if parsed.netloc == "eutils.ncbi.nlm.nih.gov":
+        return parsed.path.split("/").pop().replace(".fcgi", "")
+    elif parsed.netloc == "api.openalex.org":
+        return "openalex"
+    elif parsed.netloc == "export.arxiv.org":
+        return "arxiv"
+    else:
+        return parsed.netloc
+
+
+def cache_key(url, params=None, method="GET", data=None):
+    """
+    normalized key for a request, query parameters in the url and in params are merged and sorted so the same request
+    built in different ways hits the same entry
+    """
+    parsed = urlparse(url)
+    query = parse_qsl(parsed.query, keep_blank_values=True)
+    if params is not None:
+        query.extend((key, str(value)) for key, value in params.items() if value is not None)
+    query = sorted((key, value) for key, value in query if key not in IGNORED_PARAMS)
+    body = sorted((key, str(value)) for key, value in data.items()) if data is not None else []
+    normalized = json.dumps([method.upper(), parsed.scheme, parsed.netloc, parsed.path, query, body])
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+class ResponseCache:
+    """
+    persistent response cache for the literature apis backed by a single sqlite file. Entries expire based on a per
+    endpoint ttl and the least recently used ones are evicted when the cache is larger than max_size.
+    In offline mode nothing is fetched, a miss raises CacheMissError, this is also how you run things against recorded
+    responses.
+    """
+    def __init__(self, path, max_size=1024 ** 3, ttl=None, offline=False):
+        """
+        :param path: sqlite file, the directory is created if it does not exist
+        :param max_size: size cap in bytes for the stored responses
+        :param ttl: dict of endpoint: seconds, merged with DEFAULT_TTL, None as a value means it never expires
+        :param offline: cache only mode, misses are not fetched
+        """
+        self.path = os.path.abspath(path)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.max_size = max_size
+        self.ttl = dict(DEFAULT_TTL)
+        if ttl is not None:
+            self.ttl.update(ttl)
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+                                key TEXT PRIMARY KEY,
+                                url TEXT NOT NULL,
+                                endpoint TEXT NOT NULL,
+                                body TEXT NOT NULL,
+                                size INTEGER NOT NULL,
+                                created REAL NOT NULL,
+                                accessed REAL NOT NULL)""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ix_accessed ON responses (accessed)")
+        self.conn.commit()
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        create a cache from the http_cache section of config.yaml
+        :param config: dict with path, max_size, ttl and offline, only path is required
+        :return: ResponseCache or None if there is no path, caching is opt in
+        """
+        if config is None or not config.get("path"):
+            return None
+        return cls(config["path"], max_size=config.get("max_size", 1024 ** 3), ttl=config.get("ttl"),
+                   offline=config.get("offline", False))
+
+    def get(self, key):
+        """
+        :return: the cached body or None if there is no entry or it has expired
+        """
+        with self._lock:
+            row = self.conn.execute("SELECT body, endpoint, created FROM responses WHERE key=?", (key,)).fetchone()
+            if row is not None:
+                body, name, created = row
+                ttl = self.ttl.get(name)
+                # in offline mode stale is better than nothing
+                if ttl is None or self.offline or time.time() - created < ttl:
+                    self.conn.execute("UPDATE responses SET accessed=? WHERE key=?", (time.time(), key))
+                    self.conn.commit()
+                    self.hits += 1
+                    return body
+            self.misses += 1
+            return None
+
+    def set(self, key, url, body):
+        now = time.time()
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                              (key, url, endpoint(url), body, len(body.encode()), now, now))
+            self.conn.commit()
+            self._evict()
+        return None
+
+    def _evict(self):
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_size:
+            return None
+        removed = []
+        for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+            if total <= self.max_size:
+                break
+            removed.append((key,))
+            total -= size
+        self.conn.executemany("DELETE FROM responses WHERE key=?", removed)
+        self.conn.commit()
+        return None
+
+    def expire(self):
+        """
+        remove all the expired entries
+        """
+        now = time.time()
+        with self._lock:
+            for name, ttl in self.ttl.items():
+                if ttl is not None:
+                    self.conn.execute("DELETE FROM responses WHERE endpoint=? AND created<?", (name, now - ttl))
+            self.conn.commit()
+        return None
+
+    def clear(self):
+        with self._lock:
+            self.conn.execute("DELETE FROM responses")
+            self.conn.commit()
+        return None
+
+    def stats(self):
+        with self._lock:
+            entries, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"entries": entries, "size": size, "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        self.conn.close()
+
+    def __repr__(self):
+        return "ResponseCache(path={}, offline={})".format(self.path, self.offline)
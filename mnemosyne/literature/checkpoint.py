@@ -0,0 +1,136 @@
+import os
+import re
+import json
+import pickle
+import hashlib
+
+# the PaperInfo fields each step of PaperProcessor.pipeline fills, these are what is saved after the step is done
+STAGE_FIELDS = {
+    "extract": ("text", "tables", "figures"),
+    "embed_text": ("text_chunks", "chunk_embeddings"),
+    "embed_images": ("figure_embeddings", "table_embeddings", "figure_pooled_embeddings", "table_pooled_embeddings"),
+    "interpret_images": ("figure_interpretation", "table_interpretation"),
+    "embed_interpretations": ("figure_interpretation_embeddings", "table_interpretation_embeddings"),
+}
+
+# the step whose output each step works on, when a step is run with different settings the steps after it are too
+STAGE_UPSTREAM = {
+    "embed_text": "extract",
+    "embed_images": "extract",
+    "interpret_images": "extract",
+    "embed_interpretations": "interpret_images",
+}
+
+
+def stage_key(settings, upstream=None):
+    """
+    fingerprint of a step, the settings it is run with and the fingerprint of the step before it, so changing the
+    settings of a step also invalidates everything that was computed from its output
+    :param settings: anything json serializable, the model configs and options of the step
+    :param upstream: stage_key of the upstream step or None
+    """
+    return hashlib.sha256(json.dumps([settings, upstream], sort_keys=True, default=str).encode()).hexdigest()
+
+
+def paper_key(paper):
+    """
+    file system safe name for a paper, the id if there is one otherwise the name of the pdf
+    """
+    if paper.info.id is not None:
+        name = "{}_{}".format(paper.info.id_type, paper.info.id)
+    elif isinstance(paper.info.file_path, str):
+        name = os.path.splitext(os.path.basename(paper.info.file_path))[0]
+    else:
+        raise ValueError("Papers need an id or a file path to be checkpointed")
+    return re.sub(r"[^A-Za-z0-9._-]", "_", name)
+
+
+class PaperCheckpoint:
+    """
+    per paper record of the finished pipeline steps. Each paper has a folder with a state.json listing the steps that
+    are done with the stage_key they were run with (and the last error if a step failed) and a pickle with the output
+    of each finished step, so a restarted run only does the missing steps and the ones whose settings changed.
+    """
+    def __init__(self, directory):
+        """
+        :param directory: folder for the checkpoints, created if it does not exist
+        """
+        self.directory = os.path.abspath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, paper, name):
+        return os.path.join(self.directory, paper_key(paper), name)
+
+    def _write(self, path, write, mode="w"):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", mode) as f:
+            write(f)
+        # replace is atomic so a crash during the write does not leave a broken file behind
+        os.replace(path + ".tmp", path)
+        return None
+
+    def state(self, paper):
+        path = self._path(paper, "state.json")
+        if not os.path.exists(path):
+            return {"done": [], "keys": {}, "error": None}
+        with open(path) as f:
+            state = json.load(f)
+        state.setdefault("keys", {})
+        return state
+
+    def _set_state(self, paper, state):
+        self._write(self._path(paper, "state.json"), lambda f: json.dump(state, f))
+        return None
+
+    def restore(self, paper, stage, key=None):
+        """
+        put the saved output of a step back on the paper
+        :param key: stage_key of the current run, the saved output is only used if it was made with the same key
+        :return: True if the step was done and restored, False otherwise
+        """
+        state = self.state(paper)
+        if stage not in state["done"] or state["keys"].get(stage) != key:
+            return False
+        with open(self._path(paper, stage + ".pkl"), "rb") as f:
+            fields = pickle.load(f)
+        for field, value in fields.items():
+            setattr(paper.info, field, value)
+        return True
+
+    def save(self, paper, stage, key=None):
+        """
+        save the output of a finished step and mark it as done
+        :param key: stage_key the step was run with
+        """
+        fields = {field: getattr(paper.info, field) for field in STAGE_FIELDS[stage]}
+        self._write(self._path(paper, stage + ".pkl"), lambda f: pickle.dump(fields, f), mode="wb")
+        state = self.state(paper)
+        if stage not in state["done"]:
+            state["done"].append(stage)
+        state["keys"][stage] = key
+        state["error"] = None
+        self._set_state(paper, state)
+        return None
+
+    def fail(self, paper, stage, error):
+        state = self.state(paper)
+        state["error"] = {"stage": stage, "error": repr(error)}
+        self._set_state(paper, state)
+        return None
+
+    def failures(self):
+        """
+        :return: dict of paper key: {"stage", "error"} for the papers whose last run failed
+        """
+        failures = {}
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name, "state.json")
+            if os.path.exists(path):
+                with open(path) as f:
+                    state = json.load(f)
+                if state["error"] is not None:
+                    failures[name] = state["error"]
+        return failures
+
+    def __repr__(self):
+        return "PaperCheckpoint(directory={})".format(self.directory)
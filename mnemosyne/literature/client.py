@@ -0,0 +1,296 @@
+import asyncio
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import aiohttp
+
+from mnemosyne.literature.cache import CacheMissError, ResponseCache, cache_key
+
+# requests per second, NCBI allows 3 without and 10 with an api key, arxiv asks for one request every 3 seconds
+# openalex gives the polite pool (mailto param) more room than anonymous requests
+NCBI_HOST = "eutils.ncbi.nlm.nih.gov"
+OPENALEX_HOST = "api.openalex.org"
+ARXIV_HOST = "export.arxiv.org"
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+def default_rate_limits(pubmed_api_key=None, email=None):
+    """
+    per host rate limits in requests per second
+    :param pubmed_api_key: ncbi api key, if given the ncbi limit is 10 req/s instead of 3
+    :param email: if given openalex requests are sent to the polite pool
+    :return: dict of host: requests per second
+    """
+    return {
+        NCBI_HOST: 10 if pubmed_api_key is not None else 3,
+        OPENALEX_HOST: 10 if email is not None else 5,
+        ARXIV_HOST: 1 / 3,
+    }
+
+
+class TokenBucket:
+    """
+    token bucket rate limiter, tokens are refilled at rate per second up to capacity and each request takes one.
+    the default capacity of 1 does not allow bursts so we never go above the allowed rate in any window.
+    Each request reserves the next free slot under a thread lock and then sleeps until it, so one bucket can be shared by
+    clients running on different event loops
+    """
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """
+        take a token, the count goes below zero when the tokens are already promised to earlier requests
+        :return: seconds to wait before sending the request
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    async def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return None
+
+
+# the rate limits are per ip (or per api key) and not per client, all the clients in the process take their tokens from
+# the same bucket for a host and rate
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def shared_bucket(host, rate):
+    """
+    the process wide token bucket for a host and rate
+    :return: TokenBucket or None if rate is None
+    """
+    if rate is None:
+        return None
+    with _buckets_lock:
+        if (host, rate) not in _buckets:
+            _buckets[(host, rate)] = TokenBucket(rate)
+        return _buckets[(host, rate)]
+
+
+class LitClient:
+    """
+    asyncio based http client for the literature apis (pubmed, arxiv and openalex). Each host has its own token bucket
+    so many requests can be in flight at once without going over the rate limits, the buckets are shared by all the
+    clients in the process so two clients together do not go over them either. Connections are pooled and kept alive
+    and 429/5xx responses are retried with exponential backoff.
+
+    The client runs its own event loop in a background thread, so the blocking get and get_many methods can be called
+    from regular code (and from jupyter where there is already a running loop). Call close, or use the client in a
+    with block, to stop the thread and close the connections.
+    """
+    def __init__(self, pubmed_api_key=None, email=None, rate_limits=None, max_connections=20, max_retries=5,
+                 backoff=1.0, timeout=30, cache=None):
+        """
+        :param pubmed_api_key: ncbi api key, added to all eutils requests
+        :param email: contact email, added to eutils requests and used for the openalex polite pool
+        :param rate_limits: dict of host: requests per second, overrides the defaults
+        :param max_connections: size of the connection pool
+        :param max_retries: number of retries on 429/5xx and connection errors
+        :param backoff: base delay in seconds for exponential backoff
+        :param timeout: total timeout in seconds for a single request
+        :param cache: ResponseCache instance or the http_cache section of config.yaml, if given responses are looked up
+        there before hitting the api
+        """
+        self.pubmed_key = pubmed_api_key
+        self.email = email
+        self.rate_limits = default_rate_limits(pubmed_api_key, email)
+        if rate_limits is not None:
+            self.rate_limits.update(rate_limits)
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        if isinstance(cache, dict):
+            cache = ResponseCache.from_config(cache)
+        self.cache = cache
+
+        self._buckets = {}
+        self._session = None
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+                self._thread.start()
+        return self._loop
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=30)
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    def _bucket(self, host):
+        if host not in self._buckets:
+            # hosts we do not know about are not limited other than the connection pool
+            self._buckets[host] = shared_bucket(host, self.rate_limits.get(host))
+        return self._buckets[host]
+
+    def _params(self, host, params):
+        params = dict(params) if params is not None else {}
+        if host == NCBI_HOST:
+            params.setdefault("api_key", self.pubmed_key)
+            params.setdefault("email", self.email)
+        elif host == OPENALEX_HOST:
+            params.setdefault("mailto", self.email)
+        # unlike requests aiohttp does not drop None values
+        return {key: str(value) for key, value in params.items() if value is not None}
+
+    def _delay(self, attempt, response=None):
+        if response is not None and "Retry-After" in response.headers:
+            try:
+                return float(response.headers["Retry-After"])
+            except ValueError:
+                pass
+        return self.backoff * (2 ** attempt) + random.uniform(0, self.backoff)
+
+    async def request(self, url, params=None, method="GET", data=None, cache=True):
+        """
+        send a single request respecting the rate limit of the host
+        :param url: url to fetch
+        :param params: query parameters
+        :param method: GET or POST
+        :param data: form data for POST requests
+        :param cache: look the response up in and store it to the cache, False for responses that are only valid for a
+        short time like the pubmed history server (WebEnv) ones
+        :return: response body as text
+        """
+        use_cache = self.cache is not None and cache
+        if use_cache:
+            key = cache_key(url, params=params, method=method, data=data)
+            body = self.cache.get(key)
+            if body is not None:
+                return body
+        if self.cache is not None and self.cache.offline:
+            raise CacheMissError("{} is not in the cache and the cache is offline".format(url))
+
+        host = urlparse(url).netloc
+        bucket = self._bucket(host)
+        params = self._params(host, params)
+        session = self._get_session()
+        for attempt in range(self.max_retries + 1):
+            if bucket is not None:
+                await bucket.acquire()
+            try:
+                async with session.request(method, url, params=params, data=data) as response:
+                    if response.status in RETRY_STATUS and attempt < self.max_retries:
+                        await asyncio.sleep(self._delay(attempt, response))
+                        continue
+                    response.raise_for_status()
+                    body = await response.text()
+                    if use_cache:
+                        self.cache.set(key, url, body)
+                    return body
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(self._delay(attempt))
+
+    async def gather(self, requests, return_exceptions=True):
+        """
+        send many requests at once, each item is a dict of keyword arguments for request
+        :return: list of response bodies (or exceptions) in the same order as the requests
+        """
+        return await asyncio.gather(*[self.request(**item) for item in requests],
+                                    return_exceptions=return_exceptions)
+
+    def run(self, coro):
+        """
+        run a coroutine on the client loop and wait for the result
+        """
+        loop = self._start()
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    def submit(self, url, params=None, method="GET", data=None, cache=True):
+        """
+        start a request without waiting for it, useful for prefetching
+        :return: concurrent.futures.Future, call result() to get the response body
+        """
+        loop = self._start()
+        return asyncio.run_coroutine_threadsafe(self.request(url, params=params, method=method, data=data,
+                                                             cache=cache), loop)
+
+    def get(self, url, params=None, method="GET", data=None, cache=True):
+        """
+        blocking version of request
+        """
+        return self.run(self.request(url, params=params, method=method, data=data, cache=cache))
+
+    def get_many(self, requests, return_exceptions=True):
+        """
+        blocking version of gather, this is where the fan out happens
+        :param requests: list of dicts with url and optionally params, method, data
+        :param return_exceptions: if True failed requests are returned as exceptions instead of raising
+        :return: list of response bodies in the same order as the requests
+        """
+        return self.run(self.gather(requests, return_exceptions=return_exceptions))
+
+    def close(self):
+        if self._loop is None:
+            return None
+        if self._session is not None:
+            self.run(self._session.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop = None
+        self._thread = None
+        self._session = None
+        self._buckets = {}
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return None
+
+    def __repr__(self):
+        return "LitClient(rate_limits={})".format(self.rate_limits)
+
+
+_default_client = None
+
+
+def get_client(client=None):
+    """
+    return the given client or the shared module level one, the shared one has no api key or email
+    """
+    global _default_client
+    if client is not None:
+        return client
+    if _default_client is None:
+        _default_client = LitClient()
+    return _default_client
+
+
+def set_default_client(client):
+    """
+    replace the shared client, this is how the http_cache config (or an api key) is used by the functions and papers
+    that are not given a client
+    :param client: LitClient instance
+    """
+    global _default_client
+    _default_client = client
+    return None
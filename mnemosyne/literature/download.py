@@ -0,0 +1,194 @@
+import os
+import json
+import asyncio
+import hashlib
+import warnings
+from urllib.parse import urlparse
+
+import aiohttp
+
+from mnemosyne.literature.client import get_client
+
+PDF_MAGIC = b"%PDF"
+
+
+class DownloadError(Exception):
+    pass
+
+
+def file_hash(path, chunk_size=1 << 20):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def is_pdf(path, min_size=0, max_size=None):
+    """
+    check the %PDF magic and the size of a file
+    """
+    size = os.path.getsize(path)
+    if size < min_size or (max_size is not None and size > max_size):
+        return False
+    with open(path, "rb") as f:
+        return f.read(len(PDF_MAGIC)) == PDF_MAGIC
+
+
+class DownloadManager:
+    """
+    concurrent pdf downloader, files are streamed in chunks to a .part file next to the destination and resumed with
+    http range requests if a previous attempt was interrupted. Finished files are checked for the %PDF magic and size
+    and recorded by their sha256 in a manifest in the destination folder, files that are already there are not
+    downloaded again and identical pdfs for different ids are only stored once.
+    """
+    def __init__(self, destination, max_concurrent=8, per_host=2, chunk_size=1 << 16, timeout=120, max_retries=3,
+                 min_size=1024, max_size=200 * 1024 ** 2, client=None):
+        """
+        :param destination: folder to save the pdfs to, needs to exist
+        :param max_concurrent: total number of downloads at once
+        :param per_host: number of downloads at once from the same host
+        :param chunk_size: bytes read from the response at a time
+        :param timeout: seconds without receiving data before a download is considered stalled
+        :param max_retries: retries per file, each retry resumes from where the previous one stopped
+        :param min_size: files smaller than this are not considered pdfs (error pages etc.)
+        :param max_size: files larger than this are not downloaded
+        :param client: LitClient instance, its event loop is used to run the downloads
+        """
+        if not os.path.exists(destination):
+            raise FileNotFoundError("{} does not exist.".format(destination))
+        self.destination = os.path.abspath(destination)
+        self.max_concurrent = max_concurrent
+        self.per_host = per_host
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.min_size = min_size
+        self.max_size = max_size
+        self.client = client
+
+        self.manifest_path = os.path.join(self.destination, ".manifest.json")
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {"files": {}, "papers": {}}
+        self.failed = {}
+        self._semaphore = None
+        self._hosts = {}
+
+    def _save_manifest(self):
+        with open(self.manifest_path + ".tmp", "w") as f:
+            json.dump(self.manifest, f)
+        os.replace(self.manifest_path + ".tmp", self.manifest_path)
+
+    def _host_semaphore(self, url):
+        host = urlparse(url).netloc
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(self.per_host)
+        return self._hosts[host]
+
+    def _register(self, paper, path, digest):
+        self.manifest["files"][digest] = path
+        self.manifest["papers"][paper.info.id] = digest
+        paper.info.file_path = path
+        paper.info.downloaded = True
+
+    def _existing(self, paper, path):
+        """
+        returns True if the paper is already downloaded, either recorded in the manifest or a valid pdf in the folder
+        """
+        if not os.path.exists(path):
+            return False
+        digest = self.manifest["papers"].get(paper.info.id)
+        if digest is not None and self.manifest["files"].get(digest) == path:
+            self._register(paper, path, digest)
+            return True
+        if is_pdf(path, self.min_size, self.max_size):
+            self._register(paper, path, file_hash(path))
+            return True
+        return False
+
+    async def _fetch(self, session, url, part):
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        headers = {"Range": "bytes={}-".format(offset)} if offset > 0 else {}
+        async with session.get(url, headers=headers) as response:
+            # the part file is already complete
+            if response.status == 416:
+                return None
+            response.raise_for_status()
+            # server does not support ranges, start over
+            if offset > 0 and response.status != 206:
+                offset = 0
+            if response.content_length is not None and offset + response.content_length > self.max_size:
+                raise DownloadError("{} is larger than {} bytes".format(url, self.max_size))
+            with open(part, "ab" if offset > 0 else "wb") as f:
+                async for chunk in response.content.iter_chunked(self.chunk_size):
+                    f.write(chunk)
+        return None
+
+    async def _download_one(self, session, paper):
+        if paper.info.download_link is None:
+            self.failed[paper.info.id] = "no download link"
+            return None
+        path = os.path.join(self.destination, "{}.pdf".format(paper.info.id))
+        if self._existing(paper, path):
+            return None
+
+        url = paper.info.download_link
+        part = path + ".part"
+        # the host slot is taken first, otherwise downloads waiting on a busy host hold global slots and the other
+        # hosts are starved
+        async with self._host_semaphore(url), self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    await self._fetch(session, url, part)
+                    break
+                except (aiohttp.ClientError, asyncio.TimeoutError, DownloadError) as e:
+                    if attempt == self.max_retries or isinstance(e, DownloadError):
+                        self.failed[paper.info.id] = str(e)
+                        return None
+                    await asyncio.sleep(2 ** attempt)
+
+        if not is_pdf(part, self.min_size, self.max_size):
+            # not worth resuming, this is usually an html landing page
+            os.remove(part)
+            self.failed[paper.info.id] = "downloaded file is not a pdf"
+            return None
+
+        digest = await asyncio.get_running_loop().run_in_executor(None, file_hash, part)
+        existing = self.manifest["files"].get(digest)
+        if existing is not None and os.path.exists(existing):
+            os.remove(part)
+            path = existing
+        else:
+            os.replace(part, path)
+        self._register(paper, path, digest)
+        return None
+
+    async def _download_all(self, papers):
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        self._hosts = {}
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=self.timeout)
+        connector = aiohttp.TCPConnector(limit=self.max_concurrent)
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            await asyncio.gather(*[self._download_one(session, paper) for paper in papers])
+
+    def download(self, papers):
+        """
+        download the pdfs of the papers, info.file_path and info.downloaded are filled for the ones that succeed and the
+        reasons for the failures are in self.failed
+        :param papers: list of Paper instances with a download link (see Paper.search_info)
+        :return: the same list of papers
+        """
+        self.failed = {}
+        try:
+            get_client(self.client).run(self._download_all(papers))
+        finally:
+            self._save_manifest()
+        for paper_id, reason in self.failed.items():
+            warnings.warn("Could not download {}: {}".format(paper_id, reason))
+        return papers
+
+    def __repr__(self):
+        return "DownloadManager(destination={}, files={})".format(self.destination, len(self.manifest["files"]))
@@ -0,0 +1,244 @@
+import os
+import json
+import math
+import heapq
+import warnings
+from urllib.parse import urlparse, parse_qsl
+
+from mnemosyne.literature.client import get_client
+from mnemosyne.literature.lexical import tokenize
+from mnemosyne.literature.utils import OPENALEX_FIELDS, OPENALEX_BATCH_SIZE, search_openalex_batch
+from mnemosyne.literature.literature import paper_from_response
+
+RELATIONS = ("references", "related_works", "cited_by")
+
+
+def record_text(record):
+    """
+    the text we score a work by, title plus the names of its keywords, concepts, topics and mesh terms
+    """
+    parts = [record.get("title") or ""]
+    for field, name in (("keywords", "display_name"), ("concepts", "display_name"),
+                        ("topics", "display_name"), ("mesh", "descriptor_name")):
+        for item in record.get(field) or []:
+            parts.append(item.get(name) or "")
+    return " ".join(parts)
+
+
+def overlap_scorer(description):
+    """
+    cheap default scorer, the number of terms a work shares with the description normalized by the length of the work
+    :param description: text to score against, usually Project.description
+    :return: callable that takes a list of openalex records and returns a list of floats
+    """
+    terms = set(tokenize(description))
+
+    def score(records):
+        scores = []
+        for record in records:
+            tokens = set(tokenize(record_text(record)))
+            scores.append(len(tokens & terms) / math.sqrt(len(tokens) + 1))
+        return scores
+    return score
+
+
+class CitationGraph:
+    """
+    budgeted citation graph expansion from a seed set. Works are resolved from openalex in batches, scored against a
+    description and kept in a single deduplicated frontier keyed by the openalex id. The frontier is expanded breadth
+    first or best first (highest score first) until the depth limit, the api call budget or the node budget is reached.
+    The whole state can be checkpointed to a json file and resumed, so large snowball searches can be stopped and
+    restarted.
+    """
+    def __init__(self, description=None, scorer=None, strategy="best", relations=RELATIONS, max_depth=2,
+                 max_calls=1000, max_nodes=10000, cited_by_limit=200, client=None):
+        """
+        :param description: text to score works against, usually Project.description
+        :param scorer: callable that takes a list of openalex records and returns a list of scores, if None
+        overlap_scorer(description) is used
+        :param strategy: best for best first or bfs for breadth first
+        :param relations: which edges to follow, any of references, related_works and cited_by
+        :param max_depth: works further than this many hops from a seed are not expanded
+        :param max_calls: hard budget on the number of api calls
+        :param max_nodes: hard budget on the number of works in the graph
+        :param cited_by_limit: number of citing works to follow per node (one page), max 200
+        :param client: LitClient instance, if None the shared client is used
+        """
+        if strategy not in ["best", "bfs"]:
+            raise ValueError("strategy must be best or bfs")
+        for relation in relations:
+            if relation not in RELATIONS:
+                raise ValueError("relations must be one of {}".format(", ".join(RELATIONS)))
+        if scorer is None:
+            if description is None:
+                raise ValueError("either a description or a scorer is needed to prioritize the frontier")
+            scorer = overlap_scorer(description)
+        self.scorer = scorer
+        self.strategy = strategy
+        self.relations = list(relations)
+        self.max_depth = max_depth
+        self.max_calls = max_calls
+        self.max_nodes = max_nodes
+        self.cited_by_limit = min(cited_by_limit, 200)
+        self.client = client
+
+        self.nodes = {}  # openalex id: {"record", "depth", "score"}
+        self.edges = []  # (source, target, relation)
+        self.pending = {}  # frontier entries, same structure as nodes
+        self.seen = set()
+        self.calls = 0
+        self._frontier = []
+        self._counter = 0
+
+    def _priority(self, depth, score):
+        if self.strategy == "best":
+            return (-score, depth)
+        return (depth, -score)
+
+    def _push(self, openalex_id, record, depth, score):
+        self.pending[openalex_id] = {"record": record, "depth": depth, "score": score}
+        heapq.heappush(self._frontier, (self._priority(depth, score), self._counter, openalex_id))
+        self._counter += 1
+
+    def _budget_left(self):
+        return self.calls < self.max_calls and len(self.nodes) < self.max_nodes
+
+    def _resolve(self, openalex_ids):
+        """
+        resolve ids within the remaining call budget, returns (id, record) pairs for the ones that were found.
+        ids are marked as seen even if they are not found so they are not looked up again
+        """
+        calls_left = self.max_calls - self.calls
+        openalex_ids = openalex_ids[:calls_left * OPENALEX_BATCH_SIZE]
+        if len(openalex_ids) == 0:
+            return []
+        self.seen.update(openalex_ids)
+        self.calls += math.ceil(len(openalex_ids) / OPENALEX_BATCH_SIZE)
+        records = search_openalex_batch(openalex_ids, client=self.client)
+        return [(openalex_id, record) for openalex_id, record in zip(openalex_ids, records) if record is not None]
+
+    def _cited_by(self, record):
+        if "cited_by_api_url" not in record or self.calls >= self.max_calls:
+            return []
+        parsed = urlparse(record["cited_by_api_url"])
+        params = dict(parse_qsl(parsed.query))
+        params["per-page"] = self.cited_by_limit
+        params["select"] = ",".join(OPENALEX_FIELDS)
+        self.calls += 1
+        try:
+            content = json.loads(get_client(self.client).get(parsed._replace(query="").geturl(), params=params))
+        except Exception as e:
+            warnings.warn("Could not get the citing works of {}: {}".format(record["id"], e))
+            return []
+        return [(item["id"].split("/").pop(), item) for item in content["results"]]
+
+    def _add_records(self, pairs, depth):
+        if len(pairs) == 0:
+            return None
+        scores = self.scorer([record for _, record in pairs])
+        for (openalex_id, record), score in zip(pairs, scores):
+            self._push(openalex_id, record, depth, float(score))
+        return None
+
+    def add_seeds(self, seeds):
+        """
+        :param seeds: list of Paper instances with openalex_info (see Paper.search_info) or openalex ids/work urls
+        """
+        ids = []
+        for seed in seeds:
+            if isinstance(seed, str):
+                ids.append(seed.split("/").pop())
+            elif seed.info.openalex_info is not None and "id" in seed.info.openalex_info:
+                openalex_id = seed.info.openalex_info["id"].split("/").pop()
+                if openalex_id not in self.seen:
+                    self.seen.add(openalex_id)
+                    # seeds are always expanded first
+                    self._push(openalex_id, seed.info.openalex_info, 0, math.inf)
+            else:
+                raise ValueError("Seed papers need openalex info, call search_info first")
+        ids = [openalex_id for openalex_id in ids if openalex_id not in self.seen]
+        for openalex_id, record in self._resolve(ids):
+            self._push(openalex_id, record, 0, math.inf)
+        return self
+
+    def expand(self, checkpoint_path=None, checkpoint_every=100):
+        """
+        expand the frontier until it is empty or a budget is reached
+        :param checkpoint_path: if given the state is written here every checkpoint_every nodes and at the end
+        :param checkpoint_every: number of nodes between checkpoints
+        :return: self
+        """
+        while len(self._frontier) > 0 and self._budget_left():
+            _, _, openalex_id = heapq.heappop(self._frontier)
+            node = self.pending.pop(openalex_id)
+            self.nodes[openalex_id] = node
+            record = node["record"]
+
+            if node["depth"] < self.max_depth:
+                neighbors = []
+                for relation in self.relations:
+                    if relation == "cited_by":
+                        pairs = self._cited_by(record)
+                        for neighbor, _ in pairs:
+                            self.edges.append((neighbor, openalex_id, relation))
+                        pairs = [(neighbor, item) for neighbor, item in pairs if neighbor not in self.seen]
+                        self.seen.update(neighbor for neighbor, _ in pairs)
+                        self._add_records(pairs, node["depth"] + 1)
+                    else:
+                        for link in record.get("referenced_works" if relation == "references" else relation) or []:
+                            neighbor = link.split("/").pop()
+                            self.edges.append((openalex_id, neighbor, relation))
+                            if neighbor not in self.seen and neighbor not in neighbors:
+                                neighbors.append(neighbor)
+                self._add_records(self._resolve(neighbors), node["depth"] + 1)
+
+            if checkpoint_path is not None and len(self.nodes) % checkpoint_every == 0:
+                self.checkpoint(checkpoint_path)
+
+        if checkpoint_path is not None:
+            self.checkpoint(checkpoint_path)
+        return self
+
+    def checkpoint(self, path):
+        """
+        write the whole state (nodes, edges, frontier and budgets used) to a json file
+        """
+        state = {"nodes": self.nodes, "edges": self.edges, "pending": self.pending,
+                 "seen": sorted(self.seen), "calls": self.calls}
+        with open(path + ".tmp", "w") as f:
+            json.dump(state, f)
+        # replace is atomic so a crash during the write does not lose the previous checkpoint
+        os.replace(path + ".tmp", path)
+        return None
+
+    def resume(self, path):
+        """
+        load the state written by checkpoint, the budgets and settings are the ones this instance was created with
+        """
+        with open(path) as f:
+            state = json.load(f)
+        self.nodes = state["nodes"]
+        self.edges = [tuple(edge) for edge in state["edges"]]
+        self.seen = set(state["seen"])
+        self.calls = state["calls"]
+        self.pending = {}
+        self._frontier = []
+        for openalex_id, entry in state["pending"].items():
+            self._push(openalex_id, entry["record"], entry["depth"], entry["score"])
+        return self
+
+    def papers(self):
+        """
+        the works in the graph as papers, works without a pubmed id are skipped
+        """
+        papers = []
+        for node in self.nodes.values():
+            try:
+                papers.append(paper_from_response(node["record"], client=self.client))
+            except ValueError:
+                continue
+        return papers
+
+    def __repr__(self):
+        return "CitationGraph(nodes={}, edges={}, frontier={}, calls={})".format(len(self.nodes), len(self.edges),
+                                                                                len(self._frontier), self.calls)
@@ -0,0 +1,76 @@
+import re
+import math
+from collections import Counter
+
+import numpy as np
+
+
+def tokenize(text):
+    return [token for token in re.findall(r"[a-z0-9]+", text.lower()) if len(token) > 2]
+
+
+class BM25:
+    """
+    in memory bm25 index over a list of short documents (titles and abstracts). This is meant as a cheap first pass
+    before anything is embedded, downloaded or processed, scoring tens of thousands of abstracts takes milliseconds.
+    """
+    def __init__(self, documents, k1=1.5, b=0.75):
+        """
+        :param documents: list of strings, None is treated as an empty document
+        :param k1: term frequency saturation
+        :param b: document length normalization
+        """
+        self.k1 = k1
+        self.b = b
+        self.size = len(documents)
+        postings = {}
+        lengths = []
+        for i, document in enumerate(documents):
+            counts = Counter(tokenize(document or ""))
+            lengths.append(sum(counts.values()))
+            for term, count in counts.items():
+                postings.setdefault(term, ([], []))
+                postings[term][0].append(i)
+                postings[term][1].append(count)
+
+        self.lengths = np.array(lengths, dtype=np.float32)
+        average = self.lengths.mean() if self.size > 0 and self.lengths.mean() > 0 else 1.0
+        self.norms = k1 * (1 - b + b * self.lengths / average)
+        self.postings = {}
+        for term, (docs, counts) in postings.items():
+            idf = math.log(1 + (self.size - len(docs) + 0.5) / (len(docs) + 0.5))
+            self.postings[term] = (np.array(docs), np.array(counts, dtype=np.float32), idf)
+
+    def score(self, query):
+        """
+        :param query: string
+        :return: array with the bm25 score of each document
+        """
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(tokenize(query or "")):
+            if term not in self.postings:
+                continue
+            docs, counts, idf = self.postings[term]
+            scores[docs] += idf * counts * (self.k1 + 1) / (counts + self.norms[docs])
+        return scores
+
+    def score_many(self, queries):
+        """
+        score against several queries (the project description and the interests of each researcher), the scores of
+        each query are divided by its best score so long queries do not dominate and a document only needs to match one
+        of them well
+        :param queries: list of strings
+        :return: array with the best normalized score of each document
+        """
+        scores = np.zeros(self.size, dtype=np.float32)
+        for query in queries:
+            query_scores = self.score(query)
+            if query_scores.max(initial=0) > 0:
+                scores = np.maximum(scores, query_scores / query_scores.max())
+        return scores
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return "BM25(documents={}, terms={})".format(self.size, len(self.postings))
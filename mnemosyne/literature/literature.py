@@ -1,5 +1,5 @@
-import os.path
-import time
+import math
+from urllib.parse import urlparse, parse_qsl
 
 from dataclasses import dataclass
 from typing import Optional
@@ -8,18 +8,23 @@ import numpy as np
 from bs4 import BeautifulSoup as bs
 
 from mnemosyne.literature.utils import *
+from mnemosyne.literature.client import LitClient, get_client
+from mnemosyne.literature.download import DownloadManager, DownloadError
+from mnemosyne.literature.parsers import iter_pubmed_articles, iter_arxiv_entries, author_name
+from mnemosyne.literature.lexical import BM25
 
 class NoPapersError(Exception):
     pass
 
-def paper_from_response(openalex_response):
+def paper_from_response(openalex_response, client=None):
     if "pmid" in openalex_response["ids"].keys():
         paper_id=openalex_response["ids"]["pmid"].split("/").pop()
         id_type="pubmed"
     else:
         raise ValueError("Could not find a valid paper ID in the response.")
 
-    paper=Paper(paper_id=paper_id, id_type=id_type, search_info=False, download=False, process=False)
+    paper=Paper(paper_id=paper_id, id_type=id_type, get_abstract=False, client=client)
+    paper.info.title = openalex_response.get("title")
     paper.info.openalex_info = filter_openalex_response(openalex_response)
     if "best_oa_location" in openalex_response.keys() and openalex_response["best_oa_location"] is not None:
         link = openalex_response["best_oa_location"]["pdf_url"]
@@ -35,20 +40,140 @@ def paper_from_response(openalex_response):
     return paper
 
 
-def paper_from_link(link):
+def paper_from_link(link, client=None):
     openalex_id=link.split("/").pop()
-    info=search_openalex(paper_id=openalex_id, id_type="openalex")
-    paper=paper_from_response(info)
+    info=search_openalex(paper_id=openalex_id, id_type="openalex", client=client)
+    paper=paper_from_response(info, client=client)
     return paper
 
+ESEARCH_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
+EFETCH_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
+ARXIV_URL = "http://export.arxiv.org/api/query"
+# ncbi recommends POST when sending more than ~200 ids
+EFETCH_POST_THRESHOLD = 200
+
+def parse_pubmed_article(article):
+    """
+    parse a single PubmedArticle element (from an efetch response) into a record, this is the BeautifulSoup version
+    that is kept as the reference for the streaming parsers in parsers.py
+    :param article: bs4 tag for a PubmedArticle
+    :return: dict with id, id_type, title, abstract, authors and doi
+    """
+    abstract_text=article.find("AbstractText")
+    if abstract_text is not None:
+        abstract_text=abstract_text.text
+    title=article.find("ArticleTitle")
+    if title is not None:
+        title=title.text
+    authors=[]
+    for author in article.find_all("Author"):
+        affiliation_info=author.find("AffiliationInfo")
+        if affiliation_info is not None:
+            name=author_name(*[author.find(part).text if author.find(part) is not None else None
+                               for part in ("ForeName", "LastName", "CollectiveName")])
+            if len(affiliation_info.find_all("Affiliation"))>0:
+                authors.append({"name":name,
+                                "affiliation":(affiliation_info.find("Affiliation").text)})
+            else:
+                authors.append({"name": name,
+                                "affiliation": None})
+    # the first ArticleIdList is the article itself, the ones in the ReferenceList belong to the references
+    doi=None
+    id_list=article.find("ArticleIdList")
+    if id_list is not None:
+        for item in id_list.find_all("ArticleId"):
+            if item.attrs.get("IdType") == "doi":
+                doi=item.text
+                break
+    return {"id": article.find("PMID").text, "id_type": "pubmed", "title": title, "abstract": abstract_text,
+            "authors": authors, "doi": doi}
+
+def parse_arxiv_entry(entry):
+    """
+    parse a single atom entry element (from an arxiv query response) into a record
+    :param entry: bs4 tag for an entry
+    :return: dict with id, id_type, title, abstract, authors and doi
+    """
+    summary=entry.find("summary")
+    title=entry.find("title")
+    doi=entry.find("doi")
+    authors=[{"name": author.find("name").text, "affiliation": None} for author in entry.find_all("author")]
+    return {"id": entry.find("id").text.split("/").pop(), "id_type": "arxiv",
+            "title": title.text if title is not None else None,
+            "abstract": summary.text if summary is not None else None,
+            "authors": authors, "doi": doi.text if doi is not None else None}
+
+def fetch_records(ids, id_type="pubmed", client=None, chunk_size=None):
+    """
+    bulk version of Paper.get_abstract, the ids are sent in chunks to efetch (pubmed) or to the id_list of the arxiv
+    api so 1000 ids are a handful of requests instead of 1000. Chunks are sent concurrently through the client.
+    :param ids: list of pubmed or arxiv ids
+    :param id_type: pubmed or arxiv
+    :param client: LitClient instance, if None the shared client is used
+    :param chunk_size: ids per request, defaults to 400 for pubmed and 100 for arxiv
+    :return: list of records (dicts with id, id_type, title, abstract, authors and doi), ids that are not found are skipped
+    """
+    ids=[str(paper_id) for paper_id in ids]
+    if id_type == "pubmed":
+        chunk_size = chunk_size if chunk_size is not None else 400
+        requests_list=[]
+        for i in range(0, len(ids), chunk_size):
+            chunk=",".join(ids[i:i + chunk_size])
+            if len(ids[i:i + chunk_size]) > EFETCH_POST_THRESHOLD:
+                requests_list.append({"url": EFETCH_URL, "method": "POST",
+                                      "data": {"db": "pubmed", "id": chunk, "retmode": "xml"}})
+            else:
+                requests_list.append({"url": EFETCH_URL, "params": {"db": "pubmed", "id": chunk, "retmode": "xml"}})
+        parse=iter_pubmed_articles
+    elif id_type == "arxiv":
+        chunk_size = chunk_size if chunk_size is not None else 100
+        requests_list=[{"url": ARXIV_URL, "params": {"id_list": ",".join(ids[i:i + chunk_size]),
+                                                     "max_results": len(ids[i:i + chunk_size])}}
+                       for i in range(0, len(ids), chunk_size)]
+        parse=iter_arxiv_entries
+    else:
+        raise NotImplementedError("source must be pubmed or arxiv other sources are not implemented")
+
+    responses=get_client(client).get_many(requests_list, return_exceptions=False)
+    records=[]
+    for response in responses:
+        records.extend(parse(response))
+    return records
+
+def paper_from_record(record, client=None):
+    """
+    create a paper from a record returned by fetch_records, no api calls are made
+    """
+    paper=Paper(paper_id=record["id"], id_type=record["id_type"], get_abstract=False, client=client)
+    paper.info.title=record["title"]
+    paper.info.abstract=record["abstract"]
+    paper.info.authors=record["authors"]
+    paper.info.doi=record["doi"]
+    return paper
+
+def papers_from_ids(ids, id_type="pubmed", client=None, chunk_size=None):
+    """
+    create papers for a list of ids with a bulk fetch, see fetch_records
+    :return: list of papers with title, abstract, authors and doi filled
+    """
+    records=fetch_records(ids, id_type=id_type, client=client, chunk_size=chunk_size)
+    return [paper_from_record(record, client=client) for record in records]
+
+
 class LitSearch:
-    def __init__(self, pubmed_api_key=None, email=None, sort_by="relevance"):
+    def __init__(self, pubmed_api_key=None, email=None, sort_by="relevance", client=None, cache=None):
         """
         create the ncessary framework for searching
         :param pubmed_api_key:
+        :param client: LitClient instance, if None one is created with the api key and email so the rate limits match
+        :param cache: ResponseCache instance or the http_cache section of config.yaml for the created client, ignored
+        if a client is given
         """
         self.pubmed_key = pubmed_api_key
         self.email=email
+        if client is None:
+            client=LitClient(pubmed_api_key=self.pubmed_key, email=self.email, cache=cache)
+        self.client=client
         if sort_by not in ["relevance", "pub+date"]:
             raise ValueError("sort_by must be relevance or pub+date")
         self.sorting=sort_by
@@ -66,40 +191,139 @@ class LitSearch:
         search pubmed and arxiv for a query, this is just keyword search no other params are implemented at the moment
         :param query: this is a string that is passed to the search, as long as it is a valid query it will work and other fields can be specified
         :param database: pubmed or arxiv
-        :param results: what to return, default is paper id PMID and arxiv id
+        :param results: what to return, default is paper id PMID and arxiv id, doi for dois and paper for Paper instances
+        created from a bulk fetch of the abstracts
         :param max_results:
         :return: paper ids specific to the database
         """
         #TODO implement pubmed api key for non-free papers, implement email
         if database == "pubmed":
             search_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi?db=pubmed&term={}&retmax={}".format(query, max_results)
-            search_response = requests.get(search_url, params=self.params)
-            search_response.raise_for_status()
+            search_response = self.client.get(search_url, params=self.params)
 
-            soup = bs(search_response.text, "xml")
+            soup = bs(search_response, "xml")
             ids = [item.text for item in soup.find_all("Id")]
 
             if results == "doi":
-                dois = []
-                for paperid in ids:
-                    response = requests.get(
-                        "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi?db=pubmed&id={}".format(paperid))
-                    response.raise_for_status()
-                    soup = bs(response.text, "xml")
-                    dois.append([item.text for item in soup.find_all("ArticleId") if item.attrs["IdType"] == "doi"])
-                to_ret=dois
+                records = {record["id"]: record for record in fetch_records(ids, id_type="pubmed", client=self.client)}
+                to_ret=[[records[paperid]["doi"]] if paperid in records and records[paperid]["doi"] is not None else []
+                        for paperid in ids]
+            elif results == "paper":
+                to_ret=papers_from_ids(ids, id_type="pubmed", client=self.client)
             else:
                 to_ret=ids
 
         elif database == "arxiv":
             search_url="http://export.arxiv.org/api/search_query?{}&max_results={}".format(query, str(max_results))
-            search_response = requests.get(search_url)
-            search_response.raise_for_status()
-            soup = bs(search_response.text, "xml")
+            search_response = self.client.get(search_url)
+            soup = bs(search_response, "xml")
             ids=[item.text.split("/").pop() for item in soup.find_all("id")][1:] #first one is the search id
-            to_ret= ids
+            if results == "paper":
+                to_ret=[paper_from_record(record, client=self.client) for record in iter_arxiv_entries(search_response)]
+            else:
+                to_ret= ids
         return to_ret
 
+    def _pages(self, query, database, page_size, max_results, rettype=None):
+        """
+        yield raw pages of results, for pubmed the query is stored on the history server (usehistory=y) and the pages
+        are fetched from there with retstart, for arxiv the start parameter is used. The next page is requested while
+        the current one is being processed.
+        """
+        if database == "pubmed":
+            # the WebEnv expires after a few hours, neither the search nor the pages fetched with it can be cached
+            params=dict(self.params, db="pubmed", term=query, usehistory="y", retmax=0)
+            soup=bs(self.client.get(ESEARCH_URL, params=params, cache=False), "xml")
+            total=int(soup.find("Count").text)
+            webenv=soup.find("WebEnv").text
+            query_key=soup.find("QueryKey").text
+            if max_results is not None:
+                total=min(total, max_results)
+
+            def page(start):
+                return {"url": EFETCH_URL, "params": {"db": "pubmed", "WebEnv": webenv, "query_key": query_key,
+                                                      "retstart": start, "retmax": min(page_size, total - start),
+                                                      "retmode": "xml", "rettype": rettype}, "cache": False}
+        elif database == "arxiv":
+            # arxiv only tells us the total with the first page
+            total=page_size if max_results is None else min(page_size, max_results)
+
+            def page(start):
+                return {"url": ARXIV_URL, "params": {"search_query": query, "start": start,
+                                                     "max_results": min(page_size, total - start)}}
+        else:
+            raise NotImplementedError("database must be pubmed or arxiv other sources are not implemented")
+
+        start=0
+        future=self.client.submit(**page(start)) if total > 0 else None
+        while future is not None:
+            response=future.result()
+            if database == "arxiv" and start == 0:
+                total=int(bs(response, "xml").find("totalResults").text)
+                if max_results is not None:
+                    total=min(total, max_results)
+            start+=page_size
+            future=self.client.submit(**page(start)) if start < total else None
+            yield response
+
+    def iter_search(self, query, database="pubmed", page_size=1000, max_results=None):
+        """
+        lazy version of search for large result sets, ids are yielded page by page so memory use does not depend on the
+        number of hits
+        :param query: same as search
+        :param database: pubmed or arxiv
+        :param page_size: ids per request
+        :param max_results: stop after this many ids, None for all of them
+        :return: generator of paper ids
+        """
+        if database == "pubmed":
+            for response in self._pages(query, database, page_size, max_results, rettype="uilist"):
+                for item in bs(response, "xml").find_all("Id"):
+                    yield item.text
+        else:
+            for response in self._pages(query, database, page_size, max_results):
+                for entry in bs(response, "xml").find_all("entry"):
+                    yield entry.find("id").text.split("/").pop()
+
+    def iter_records(self, query, database="pubmed", page_size=200, max_results=None):
+        """
+        search and fetch the abstracts in one go, the records come straight from the history server (pubmed) or the
+        search pages (arxiv) so there is no separate id list
+        :return: generator of records, see fetch_records
+        """
+        parse = iter_pubmed_articles if database == "pubmed" else iter_arxiv_entries
+        for response in self._pages(query, database, page_size, max_results):
+            yield from parse(response)
+
+    def iter_papers(self, query, database="pubmed", page_size=200, max_results=None):
+        """
+        same as iter_records but yields Paper instances
+        """
+        for record in self.iter_records(query, database=database, page_size=page_size, max_results=max_results):
+            yield paper_from_record(record, client=self.client)
+
+
+    def triage(self, query, targets, database="pubmed", keep=0.1, min_keep=10, page_size=200, max_results=10000):
+        """
+        cheap first pass over the results of a broad query. The titles and abstracts are fetched in bulk, indexed with
+        bm25 and scored against the targets, only the best ones are turned into papers so only those go on to
+        embedding scoring, downloading and processing
+        :param query: search query, see search
+        :param targets: list of texts to score against, usually the project description and the researchers interests
+        :param database: pubmed or arxiv
+        :param keep: fraction of the results to keep
+        :param min_keep: keep at least this many, even if it is more than the fraction
+        :param max_results: maximum number of search results to fetch, all of them are kept in memory until they are
+        scored so a broad query should not be fetched without a limit
+        :return: list of (paper, score) with the best scores first
+        """
+        records = list(self.iter_records(query, database=database, page_size=page_size, max_results=max_results))
+        index = BM25([" ".join([record["title"] or "", record["abstract"] or ""]) for record in records])
+        scores = index.score_many(targets)
+        count = min(len(records), max(min_keep, math.ceil(keep * len(records))))
+        order = np.argsort(-scores, kind="stable")[:count]
+        return [(paper_from_record(records[i], client=self.client), float(scores[i])) for i in order]
+
 
 @dataclass
 class PaperInfo:
@@ -116,10 +340,13 @@ class PaperInfo:
     figure_embeddings: Optional[np.ndarray] = None
     tables: Optional[list] = None
     table_embeddings: Optional[np.ndarray] = None
+    figure_pooled_embeddings: Optional[np.ndarray] = None
+    table_pooled_embeddings: Optional[np.ndarray] = None
     figure_interpretation: Optional[str] = None
     table_interpretation: Optional[str] = None
     figure_interpretation_embeddings: Optional[np.ndarray] = None
     table_interpretation_embeddings: Optional[np.ndarray] = None
+    doi: Optional[str] = None
     download_link: str = None
     downloaded: bool = False
     file_path: str = None
@@ -129,7 +356,7 @@ class PaperInfo:
     cited_by: Optional[list] = None
 
 class Paper:
-    def __init__(self, paper_id, id_type="pubmed", get_abstract=True):
+    def __init__(self, paper_id, id_type="pubmed", get_abstract=True, client=None):
         """
         This class is used to download and process a paper from a given id, it can also be used to process a paper from a file
         :param paper_id:
@@ -138,8 +365,10 @@ class Paper:
         :param citations: if you want to get the citations for the paper, need paper id, cannot do it with pdf
         :param references: if you want to get the references for the paper, need paper id, cannot do it with pdf
         :param related_works: if you want to get the related works for the paper, need paper id, cannot do it with pdf
+        :param client: LitClient instance used for all the api calls, if None the shared client is used
         """
         self.info=PaperInfo(paper_id, id_type)
+        self.client=client
         if get_abstract:
             self.info.abstract, self.info.title, self.info.authors= self.get_abstract()
 
@@ -147,51 +376,22 @@ class Paper:
     #I cannot imagine a paper where there are not authors I'm not writing a check for that.
     def get_abstract(self):
         if self.info.id_type =="pubmed":
-            response=requests.get("https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi?db=pubmed&id={}".format(self.info.id))
-            response.raise_for_status()
-            soup=bs(response.text, "xml")
-            abstract_text=soup.find("AbstractText")
-            if abstract_text is not None:
-                abstract_text=abstract_text.text
-            else:
-                abstract_text=None
-            title=soup.find("ArticleTitle").text
-            author_tags=soup.find_all("Author")
-            authors=[]
-            for author in author_tags:
-                affiliation_info=author.find("AffiliationInfo")
-                if affiliation_info is not None:
-                    if len(affiliation_info.find_all("Affiliation"))>0:
-                        authors.append({"name":(author.find("ForeName").text + ", " + author.find("LastName").text),
-                                    "affiliation":(author.find("AffiliationInfo").find("Affiliation").text)})
-                    else:
-                        authors.append({"name": (author.find("ForeName").text + ", " + author.find("LastName").text),
-                                        "affiliation": None})
-
+            response=get_client(self.client).get(EFETCH_URL, params={"db": "pubmed", "id": self.info.id, "retmode": "xml"})
+            record=next(iter_pubmed_articles(response), None)
         elif self.info.id_type == "arxiv":
-            response = requests.get("http://export.arxiv.org/api/query?search_query=id:{}".format(self.info.id))
-            response.raise_for_status()
-            soup=bs(response.text, "xml")
-            abstract_text = soup.find("summary").text
-            #not ideal if arxiv changes things, this will break
-            title=soup.find_all("title")
-            if len(title)==2:
-                title=title[1].text
-            else:
-                title=None
-            author_tags = soup.find_all("author")
-            authors = []
-            for author in author_tags:
-                authors.append({"name": author.find("name").text,
-                                "affiliation": None})
-
+            response = get_client(self.client).get(ARXIV_URL, params={"search_query": "id:{}".format(self.info.id)})
+            record=next(iter_arxiv_entries(response), None)
         else:
             raise NotImplementedError("source must be pubmed or arxiv other sources are not implemented")
 
-        return abstract_text, title, authors
+        if record is None:
+            raise ValueError("Could not find a paper with id {}".format(self.info.id))
+
+        self.info.doi=record["doi"]
+        return record["abstract"], record["title"], record["authors"]
 
     def search_info(self):
-        openalex_info = search_openalex(id_type=self.info.id_type, paper_id=self.info.id)
+        openalex_info = search_openalex(id_type=self.info.id_type, paper_id=self.info.id, client=self.client)
         if openalex_info is None:
             warnings.warn("Could not find a paper with id {}".format(self.info.id))
 
@@ -213,69 +413,93 @@ class Paper:
         return None
 
     def download(self, destination):
-        download = requests.get(self.info.download_link, stream=True)
-        download.raise_for_status()
-        with open("{}/{}.pdf".format(destination, self.info.id), "wb") as f:
-            f.write(download.content)
-        file_path=os.path.abspath(os.path.join("{}/{}.pdf".format(destination, self.info.id)))
-        self.info.file_path=file_path
+        """
+        download the pdf, for many papers use DownloadManager directly so they are downloaded concurrently
+        :param destination: folder to save the pdf to
+        """
+        manager=DownloadManager(destination, client=self.client)
+        manager.download([self])
+        if not self.info.downloaded:
+            raise DownloadError("Could not download {}: {}".format(self.info.id, manager.failed.get(self.info.id)))
         return None
 
     def get_references(self):
         if "referenced_works" not in self.info.openalex_info.keys():
             raise ValueError("The response does not contain references.")
         references=self.info.openalex_info["referenced_works"]
-        papers=[]
-        for reference in references:
-            try:
-                p=paper_from_link(reference)
-                papers.append(p)
-                time.sleep(0.3)
-            except:
-                print("Could not find a paper with id {}".format(reference.split("/").pop()))
-
-        self.info.references=papers
+        self.info.references=resolve_openalex_works(references, client=self.client)
         return None
 
     def get_related_works(self):
         if "related_works" not in self.info.openalex_info.keys():
             raise ValueError("The response does not contain related works.")
         references = self.info.openalex_info["related_works"]
-        papers = []
-        for reference in references:
-            try:
-                p = paper_from_link(reference)
-                papers.append(p)
-                time.sleep(0.3)
-            except:
-                print("Could not find a paper with id {}".format(reference.split("/").pop()))
-        self.info.related_works=papers
+        self.info.related_works=resolve_openalex_works(references, client=self.client)
         return None
 
-    def get_cited_by(self, cursor="*"):
+    def iter_cited_by(self, max_results=None, min_year=None, relevance=None, min_relevance=None, per_page=200):
+        """
+        walk the openalex cursor pagination of the works citing this paper and yield them as they arrive, the next page
+        is requested while the current one is being turned into papers so there is at most one page in memory plus the
+        one being fetched.
+        :param max_results: stop after this many papers
+        :param min_year: only works published in or after this year, this is filtered by openalex
+        :param relevance: callable that takes the openalex response of a citing work and returns a score, needs
+        min_relevance
+        :param min_relevance: works with a relevance score below this are skipped, needs relevance
+        :param per_page: results per page, 200 is the openalex maximum
+        :return: generator of papers
+        """
         if "cited_by_api_url" not in self.info.openalex_info.keys():
             raise ValueError("The response does not contain cited by information.")
-        url = self.info.openalex_info["cited_by_api_url"] + "&cursor="
-        content = requests.get(url + cursor).content.decode().strip()
-        content = json.loads(content)
-        next_cursor = content["meta"]["next_cursor"]
-        papers = []
-        if len(content["results"]) > 0:
-            for item in content["results"]:
-                try:
-                    p = paper_from_response(item)
-                    papers.append(p)
-                    time.sleep(0.3)
-                except:
-                    print("Could not find a paper with id {}".format(item["ids"]["pmid"].split("/").pop()))
-                finally:
-                    cursor=next_cursor
-            while next_cursor != cursor and next_cursor is not None:
-                self.get_cited_by(next_cursor)
-            self.info.cited_by=papers
-        else:
+        if (min_relevance is None) != (relevance is None):
+            raise ValueError("relevance and min_relevance need to be given together")
+        parsed = urlparse(self.info.openalex_info["cited_by_api_url"])
+        params = dict(parse_qsl(parsed.query))
+        if min_year is not None:
+            params["filter"] = params["filter"] + ",publication_year:>{}".format(int(min_year) - 1)
+        params["per-page"] = per_page
+        params["select"] = ",".join(OPENALEX_FIELDS)
+        url = parsed._replace(query="").geturl()
+
+        client = get_client(self.client)
+        future = client.submit(url, params=dict(params, cursor="*"))
+        count = 0
+        try:
+            while future is not None:
+                content = json.loads(future.result().strip())
+                next_cursor = content["meta"].get("next_cursor")
+                if next_cursor is not None and len(content["results"]) > 0:
+                    future = client.submit(url, params=dict(params, cursor=next_cursor))
+                else:
+                    future = None
+
+                for item in content["results"]:
+                    if relevance is not None and relevance(item) < min_relevance:
+                        continue
+                    try:
+                        p = paper_from_response(item, client=self.client)
+                    except:
+                        print("Could not find a paper with id {}".format(item["id"].split("/").pop()))
+                        continue
+                    yield p
+                    count += 1
+                    if max_results is not None and count >= max_results:
+                        return None
+        finally:
+            # the generator can also be closed early by the caller, the prefetched page is not needed then
+            if future is not None:
+                future.cancel()
+
+    def get_cited_by(self, max_results=None, min_year=None, relevance=None, min_relevance=None):
+        """
+        collect the citing works into info.cited_by, see iter_cited_by for the parameters, for highly cited papers use
+        iter_cited_by directly with a max_results
+        """
+        self.info.cited_by = list(self.iter_cited_by(max_results=max_results, min_year=min_year,
+                                                     relevance=relevance, min_relevance=min_relevance))
+        if len(self.info.cited_by) == 0:
             warnings.warn("No papers found that cite this work")
-            self.info.cited_by=[]
         return None
 
     def __str__(self):
@@ -0,0 +1,164 @@
+import gc
+import json
+import time
+import threading
+import warnings
+from collections import OrderedDict
+
+GB = 1024 ** 3
+
+
+def model_size(model):
+    """
+    memory used by the parameters and buffers of a model, split by where they live. Anything that is not a torch module
+    is searched for one (tuples of processor and model, the detectron2 predictor etc.), things without any torch
+    modules (model2vec) count as 0.
+    :return: dict with ram and vram in bytes
+    """
+    size = {"ram": 0, "vram": 0}
+    seen = set()
+
+    def visit(obj, depth=0):
+        if obj is None or id(obj) in seen or depth > 3:
+            return None
+        seen.add(id(obj))
+        if hasattr(obj, "parameters") and hasattr(obj, "buffers"):
+            for tensor in list(obj.parameters()) + list(obj.buffers()):
+                device = "vram" if tensor.device.type == "cuda" else "ram"
+                size[device] += tensor.numel() * tensor.element_size()
+        elif isinstance(obj, (tuple, list)):
+            for item in obj:
+                visit(item, depth + 1)
+        else:
+            for attr in ("model", "predictor", "embedding_model"):
+                visit(getattr(obj, attr, None), depth + 1)
+        return None
+
+    visit(model)
+    return size
+
+
+def empty_cuda_cache():
+    try:
+        import torch
+    except ImportError:
+        return None
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+    return None
+
+
+class ModelPool:
+    """
+    keeps the models used by PaperProcessor loaded between calls. Models are loaded the first time they are asked for
+    and identified by their name and config section, so changing the config loads a new one. When the models use more
+    ram or vram than the budget the least recently used ones are unloaded. Load and unload times are kept in stats.
+
+    Models that are unloaded while they are still used by someone (for example another step of pipeline_stream) are
+    only freed once that step is done with them.
+    """
+    def __init__(self, max_ram=None, max_vram=None):
+        """
+        :param max_ram: budget in bytes for models in ram, None means no limit
+        :param max_vram: budget in bytes for models on the gpu, None means no limit
+        """
+        self.max_ram = max_ram
+        self.max_vram = max_vram
+        self.models = OrderedDict()  # key: (model, size)
+        self.sizes = {}  # sizes of everything we have loaded, used to make room before loading it again
+        self.stats = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def key(name, config):
+        return name + ":" + json.dumps(config, sort_keys=True, default=str)
+
+    def _usage(self):
+        usage = {"ram": 0, "vram": 0}
+        for _, size in self.models.values():
+            usage["ram"] += size["ram"]
+            usage["vram"] += size["vram"]
+        return usage
+
+    def _over_budget(self, extra=None):
+        usage = self._usage()
+        if extra is not None:
+            usage = {device: usage[device] + extra[device] for device in usage}
+        return ((self.max_ram is not None and usage["ram"] > self.max_ram) or
+                (self.max_vram is not None and usage["vram"] > self.max_vram))
+
+    def _make_room(self, keep=None, extra=None):
+        while self._over_budget(extra):
+            candidates = [key for key in self.models if key != keep]
+            if len(candidates) == 0:
+                break
+            self.unload(candidates[0])
+        return None
+
+    def get(self, name, config, loader):
+        """
+        return the model for this name and config, loading it with loader if it is not in the pool
+        :param name: name of the config section, this is only used to make the key readable
+        :param config: the config section the model is built from
+        :param loader: callable without arguments that loads the model
+        :return: whatever loader returns
+        """
+        key = self.key(name, config)
+        with self._lock:
+            stats = self.stats.setdefault(key, {"name": name, "loads": 0, "load_time": 0.0, "unloads": 0,
+                                                "unload_time": 0.0, "hits": 0})
+            if key in self.models:
+                self.models.move_to_end(key)
+                stats["hits"] += 1
+                return self.models[key][0]
+
+            if key in self.sizes:
+                self._make_room(extra=self.sizes[key])
+            start = time.perf_counter()
+            model = loader()
+            stats["load_time"] += time.perf_counter() - start
+            stats["loads"] += 1
+
+            size = model_size(model)
+            self.sizes[key] = size
+            self.models[key] = (model, size)
+            self._make_room(keep=key)
+            if self._over_budget():
+                warnings.warn("{} alone is larger than the model pool budget".format(name))
+            return model
+
+    def unload(self, key):
+        with self._lock:
+            if key not in self.models:
+                return None
+            start = time.perf_counter()
+            del self.models[key]
+            gc.collect()
+            empty_cuda_cache()
+            self.stats[key]["unload_time"] += time.perf_counter() - start
+            self.stats[key]["unloads"] += 1
+        return None
+
+    def clear(self):
+        with self._lock:
+            for key in list(self.models):
+                self.unload(key)
+        return None
+
+    def usage(self):
+        """
+        :return: dict with the ram and vram in bytes used by the loaded models
+        """
+        with self._lock:
+            return self._usage()
+
+    def __contains__(self, key):
+        return key in self.models
+
+    def __len__(self):
+        return len(self.models)
+
+    def __repr__(self):
+        usage = self.usage()
+        return "ModelPool(models={}, ram={:.2f}GB, vram={:.2f}GB)".format(len(self.models), usage["ram"] / GB,
+                                                                         usage["vram"] / GB)
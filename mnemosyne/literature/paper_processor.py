@@ -1,20 +1,554 @@
 import os
-# this is weirdly needed to get tesseract to work
-os.environ["TESSDATA_PREFIX"]=f"{os.environ['CONDA_PREFIX']}/share/tessdata"
+import json
+import time
+import queue
+import threading
+import warnings
+import tempfile
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+# this is weirdly needed to get tesseract to work in a conda environment
+if os.environ.get("CONDA_PREFIX") is not None:
+    os.environ.setdefault("TESSDATA_PREFIX", os.path.join(os.environ["CONDA_PREFIX"], "share", "tessdata"))
 
-import torch
+import numpy as np
 
 import pymupdf
 from PIL import Image
 import pytesseract
-import layoutparser as lp
 
-from chonkie import SemanticChunker, Model2VecEmbeddings
-from sentence_transformers import SentenceTransformer
+# torch, layoutparser, chonkie, sentence_transformers, transformers and colpali take seconds to import, they are
+# imported in the functions that use them so importing this module (and everything that imports it) stays fast
+
+from mnemosyne.literature.models import ModelPool, empty_cuda_cache
+from mnemosyne.literature.checkpoint import PaperCheckpoint, STAGE_UPSTREAM, paper_key, stage_key
+from mnemosyne.literature.download import file_hash
+from mnemosyne.literature.artifact_cache import ArtifactCache, content_hash
+from mnemosyne.literature.utils import text_score
+
+LAYOUT_LABELS = {0: "Text", 1: "Title", 2: "List", 3: "Table", 4: "Figure"}
+
+def load_layout_model(lp_config):
+    """
+    load the detectron2 layout model from the lp_model section of the config
+    """
+    import layoutparser as lp
+    return lp.Detectron2LayoutModel(model_path=lp_config["model_path"],
+                                    config_path=lp_config["config_path"],
+                                    label_map=LAYOUT_LABELS,
+                                    extra_config=["MODEL.ROI_HEADS.SCORE_THRESH_TEST", 0.8],
+                                    )
+
+def open_document(source):
+    """
+    open a pdf from a path, bytes or an already opened pymupdf document
+    """
+    if isinstance(source, pymupdf.Document):
+        return source
+    elif isinstance(source, (bytes, bytearray)):
+        return pymupdf.open(stream=source, filetype="pdf")
+    else:
+        return pymupdf.open(source)
+
+TEXT_STRATEGIES = ["native", "ocr", "auto"]
+
+def usable_text(text, min_chars=50):
+    """
+    whether the text layer of a page is worth using, scanned pages have no text and some pdfs have broken font
+    encodings that give mostly symbols
+    """
+    text = text.strip()
+    if len(text) == 0:
+        return False
+    alnum = sum(char.isalnum() for char in text)
+    readable = alnum + sum(char.isspace() or char in ".,;:()-'\"" for char in text)
+    return alnum >= min_chars and readable / len(text) >= 0.8
+
+def native_text(page):
+    """
+    text layer of the page in reading order
+    :return: page text and the text blocks as (rect, text)
+    """
+    blocks = [(pymupdf.Rect(block[:4]), block[4]) for block in page.get_text("blocks", sort=True) if block[6] == 0]
+    return "\n".join(text for _, text in blocks), blocks
+
+def ocr_missing_regions(page, blocks, zoom=2, min_image_area=0.1):
+    """
+    ocr the images on a page that do not have any text layer on top of them (scanned figures, text inside images),
+    small images like logos are skipped. Only the image regions are rendered
+    """
+    texts = []
+    page_area = abs(page.rect)
+    for info in page.get_image_info():
+        rect = pymupdf.Rect(info["bbox"]) & page.rect
+        if rect.is_empty or abs(rect) / page_area < min_image_area:
+            continue
+        if any(rect.intersects(block_rect) for block_rect, _ in blocks):
+            continue
+        texts.append(pytesseract.image_to_string(render_clip(page, rect, dpi=zoom * 72)))
+    return texts
+
+def render_page(page, zoom):
+    pix = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom))
+    return Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+
+def render_clip(page, rect, dpi=144):
+    """
+    render only a region of the page
+    :param rect: region in page coordinates (points)
+    :param dpi: resolution of the render, 72 is zoom 1
+    """
+    pix = page.get_pixmap(clip=rect, dpi=dpi)
+    return Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+
+def detect_layouts(model, images, batch_size=8):
+    """
+    run the layout model over many page images, detectron2 models see batch_size images per forward pass instead of
+    one, other layoutparser models fall back to one image at a time
+    :param model: layoutparser layout model
+    :param images: list of pillow images
+    :param batch_size: images per forward pass
+    :return: list of layouts in the same order as the images
+    """
+    import torch
+
+    predictor = getattr(model, "model", None)
+    if not hasattr(predictor, "aug") or not hasattr(predictor, "model"):
+        return [model.detect(image) for image in images]
+
+    layouts = []
+    for start in range(0, len(images), batch_size):
+        inputs = []
+        for image in images[start:start + batch_size]:
+            # this is what layoutparser and DefaultPredictor do for a single image
+            image = np.asarray(image.convert("RGB"))
+            if predictor.input_format == "RGB":
+                image = image[:, :, ::-1]
+            height, width = image.shape[:2]
+            transformed = predictor.aug.get_transform(image).apply_image(image)
+            inputs.append({"image": torch.as_tensor(transformed.astype("float32").transpose(2, 0, 1)),
+                           "height": height, "width": width})
+        with torch.no_grad():
+            outputs = predictor.model(inputs)
+        layouts.extend(model.gather_output(output) for output in outputs)
+    return layouts
+
+def page_content(page, layout, zoom=2, layout_zoom=2, crop_dpi=None, pix=None, text_strategy="ocr", min_chars=50,
+                 min_image_area=0.1):
+    """
+    figure/table crops and text for a single page once its layout is known, the figures and tables are rendered on
+    their own at crop_dpi and the whole page is only rendered at zoom if it needs ocr
+    :param page: pymupdf page
+    :param layout: layout detected on the page rendered at layout_zoom
+    :param zoom: zoom for ocr
+    :param layout_zoom: zoom the layout was detected at, the blocks are scaled from this to page coordinates
+    :param crop_dpi: resolution of the figure and table crops, defaults to the same resolution as zoom
+    :param pix: the page already rendered at zoom, rendered if None and ocr is needed
+    :param text_strategy: native uses the text layer of the pdf, ocr runs tesseract on the rendered page and auto uses
+    the text layer and only runs ocr on pages or images that do not have a usable one
+    :param min_chars: minimum number of characters for a text layer to be considered usable (auto)
+    :param min_image_area: images smaller than this fraction of the page are not ocr'd (auto)
+    :return: page text, tables and figures as pillow images
+    """
+    if crop_dpi is None:
+        crop_dpi = zoom * 72
+    figures = []
+    tables = []
+    for block in layout:
+        if block.type in ["Figure", "Table"]:
+            coords = block.block
+            rect = pymupdf.Rect(coords.x_1, coords.y_1, coords.x_2, coords.y_2) / layout_zoom & page.rect
+            if rect.is_empty:
+                continue
+            if block.type == "Figure":
+                figures.append(render_clip(page, rect, crop_dpi))
+            else:
+                tables.append(render_clip(page, rect, crop_dpi))
+
+    return page_text(page, zoom, pix, text_strategy, min_chars, min_image_area), tables, figures
+
+def page_text(page, zoom=2, pix=None, text_strategy="ocr", min_chars=50, min_image_area=0.1):
+    """
+    text of a single page, this is the part of page_content that depends on the text strategy
+    :param page: pymupdf page
+    :param zoom: zoom for ocr
+    :param pix: the page already rendered at zoom, rendered if None and ocr is needed
+    :param text_strategy: native, ocr or auto, see page_content
+    :return: page text
+    """
+    if text_strategy == "ocr":
+        return pytesseract.image_to_string(pix if pix is not None else render_page(page, zoom))
+    text, blocks = native_text(page)
+    if text_strategy == "auto":
+        if not usable_text(text, min_chars):
+            return pytesseract.image_to_string(pix if pix is not None else render_page(page, zoom))
+        return "\n".join([text] + ocr_missing_regions(page, blocks, zoom, min_image_area))
+    return text
+
+def extract_pages(model, pages, batch_size=8, zoom=2, layout_zoom=None, text_strategy="ocr", **options):
+    """
+    extract a stream of pages that can come from one or more papers, pages are rendered at layout_zoom and their
+    layouts detected batch_size pages at a time, then the figures and tables are rendered at crop_dpi and the text is
+    extracted, the full page is only rendered at zoom for ocr
+    :param model: layout model
+    :param pages: iterable of (key, pymupdf page), the key is passed through so the pages can be put back together
+    :param batch_size: pages per layout detection batch
+    :param zoom: zoom for ocr
+    :param layout_zoom: zoom for layout detection, same as zoom if None. detectron2 resizes the images anyway so a
+    lower zoom gives the same layouts for less rendering
+    :param text_strategy: native, ocr or auto, see page_content
+    :param options: crop_dpi, min_chars and min_image_area, see page_content
+    :return: generator of (key, text, tables, figures) in the same order as the pages
+    """
+    if text_strategy not in TEXT_STRATEGIES:
+        raise ValueError("text_strategy must be one of {}".format(", ".join(TEXT_STRATEGIES)))
+    if layout_zoom is None:
+        layout_zoom = zoom
+
+    pages = iter(pages)
+    while True:
+        batch = [item for _, item in zip(range(batch_size), pages)]
+        if len(batch) == 0:
+            break
+        renders = [render_page(page, layout_zoom) for _, page in batch]
+        layouts = detect_layouts(model, renders, batch_size)
+        for (key, page), render, layout in zip(batch, renders, layouts):
+            pix = render if layout_zoom == zoom else None
+            yield (key, *page_content(page, layout, zoom, layout_zoom, pix=pix, text_strategy=text_strategy, **options))
+
+def extract_page(model, page, zoom=2, text_strategy="ocr", **options):
+    """
+    layout detection, figure/table crops and text for a single page, see extract_pages for the options
+    :return: page text, tables and figures as pillow images
+    """
+    _, page_text, tables, figures = next(extract_pages(model, [(None, page)], batch_size=1, zoom=zoom,
+                                                       text_strategy=text_strategy, **options))
+    return page_text, tables, figures
+
+def join_pages(texts):
+    texts = [text.replace("\n", " ").replace("  ", " ") for text in texts]
+    return " ".join(texts)
+
+def word_f1(text, reference):
+    """
+    word level f1 of a text against a reference, the order of the words is ignored
+    """
+    text, reference = Counter(text.lower().split()), Counter(reference.lower().split())
+    overlap = sum((text & reference).values())
+    if overlap == 0:
+        return 0.0
+    precision, recall = overlap / sum(text.values()), overlap / sum(reference.values())
+    return 2 * precision * recall / (precision + recall)
+
+def compare_text_strategies(file_paths, references=None, zoom=2, strategies=TEXT_STRATEGIES, **options):
+    """
+    small accuracy/speed comparison of the text strategies on sample pdfs. Only the text step is timed, layout
+    detection and the figure crops are the same for every strategy and are left out, the page render is included for
+    ocr since it is only needed for it. The accuracy is the word level f1 against the references, if there are none the
+    text layer of the pdf is used, that only makes sense for born digital pdfs and native gets 1 by definition.
+    :param file_paths: list of sample pdfs
+    :param references: list with the correct text of each pdf (a labelled sample), the text layer is used if None
+    :param zoom: zoom for ocr
+    :param strategies: strategies to compare
+    :param options: min_chars and min_image_area, see page_content
+    :return: dict of strategy: {"seconds": total time, "seconds_per_page", "f1": mean f1 against the references}
+    """
+    docs = [open_document(file_path) for file_path in file_paths]
+    if references is None:
+        references = [join_pages([native_text(page)[0] for page in doc]) for doc in docs]
+    elif len(references) != len(docs):
+        raise ValueError("There needs to be one reference per pdf")
+    num_pages = sum(len(doc) for doc in docs)
+
+    results = {}
+    for strategy in strategies:
+        if strategy not in TEXT_STRATEGIES:
+            raise ValueError("text_strategy must be one of {}".format(", ".join(TEXT_STRATEGIES)))
+        seconds = 0
+        scores = []
+        for doc, reference in zip(docs, references):
+            texts = []
+            for page in doc:
+                start = time.perf_counter()
+                texts.append(page_text(page, zoom, text_strategy=strategy, **options))
+                seconds += time.perf_counter() - start
+            scores.append(word_f1(join_pages(texts), reference))
+        results[strategy] = {"seconds": seconds, "seconds_per_page": seconds / num_pages if num_pages > 0 else None,
+                             "f1": sum(scores) / len(scores) if len(scores) > 0 else None}
+    return results
+
+# each worker process has its own layout model, it is loaded once when the worker starts
+_worker_model = None
+
+def _init_worker(lp_config):
+    import torch
+
+    global _worker_model
+    # there is one worker per core, torch and tesseract should not start their own threads on top of that
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+    torch.set_num_threads(1)
+    _worker_model = load_layout_model(lp_config)
+
+def _extract_pages(file_path, page_numbers, options):
+    with open_document(file_path) as doc:
+        return list(extract_pages(_worker_model, ((number, doc[number]) for number in page_numbers), **options))
+
+def encode_texts(model, texts, batch_size=64, dtype="float32", normalize=False):
+    """
+    embed a list of texts with a sentence transformer in large batches. Texts are sorted by length so each batch has
+    texts of similar length and there is little padding, the embeddings are returned in the original order.
+    :param model: sentence transformer
+    :param texts: list of strings
+    :param batch_size: number of texts per forward pass
+    :param dtype: float32 or float16 for the returned array
+    :param normalize: l2 normalize the embeddings
+    :return: numpy array of shape (len(texts), embedding dimension)
+    """
+    embeddings = np.zeros((len(texts), model.get_sentence_embedding_dimension()), dtype=dtype)
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        embeddings[batch] = model.encode([texts[i] for i in batch], batch_size=len(batch),
+                                         normalize_embeddings=normalize, convert_to_numpy=True)
+    return embeddings
+
+
+# torch is the full precision model on whatever device is available, the rest are for cpu only hosts
+EMBEDDING_BACKENDS = ("torch", "int8", "onnx", "openvino")
+
+
+def load_text_embedding_model(text_embedding_config, backend=None):
+    """
+    load the sentence transformer from the text_embedding_model section of the config with one of the backends
+    + torch: the model as is
+    + int8: dynamic int8 quantization of the linear layers, cpu only
+    + onnx / openvino: the model exported to (or loaded from, see file_name) onnx runtime or openvino, cpu only. These
+    need sentence-transformers[onnx] or sentence-transformers[openvino]
+    threads sets the number of cpu threads of the onnx and openvino sessions, for int8 torch only has a process wide
+    setting so it changes the number of threads of everything else that runs on torch in this process as well, it is
+    ignored for torch. dimension, if given, is checked against the model so the vectors fit the knowledgebase columns
+    :param text_embedding_config: text_embedding_model section of the config
+    :param backend: overrides the backend in the config
+    :return: sentence transformer
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    if backend is None:
+        backend = text_embedding_config.get("backend", "torch")
+    if backend not in EMBEDDING_BACKENDS:
+        raise NotImplementedError("backend must be one of {}".format(", ".join(EMBEDDING_BACKENDS)))
+    kwargs = dict(text_embedding_config.get("config") or {})
+    threads = text_embedding_config.get("threads")
+
+    if backend in ["torch", "int8"]:
+        if backend == "int8":
+            kwargs["device"] = "cpu"
+            if threads is not None:
+                # process wide, there is no per model setting in torch
+                torch.set_num_threads(threads)
+        model = SentenceTransformer(text_embedding_config["name"], **kwargs)
+        if backend == "int8":
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    else:
+        model_kwargs = dict(kwargs.pop("model_kwargs", {}))
+        if text_embedding_config.get("file_name") is not None:
+            model_kwargs["file_name"] = text_embedding_config["file_name"]
+        if threads is not None and backend == "onnx":
+            import onnxruntime
+            session_options = onnxruntime.SessionOptions()
+            session_options.intra_op_num_threads = threads
+            model_kwargs["session_options"] = session_options
+        elif threads is not None and backend == "openvino":
+            model_kwargs["ov_config"] = {"INFERENCE_NUM_THREADS": str(threads)}
+        model = SentenceTransformer(text_embedding_config["name"], backend=backend, device="cpu",
+                                    model_kwargs=model_kwargs, **kwargs)
+
+    dimension = text_embedding_config.get("dimension")
+    if dimension is not None and model.get_sentence_embedding_dimension() != dimension:
+        raise ValueError("{} gives {} dimensional vectors, the config expects {}".format(
+            text_embedding_config["name"], model.get_sentence_embedding_dimension(), dimension))
+    return model
+
+
+def benchmark_embedding_backends(text_embedding_config, texts, backends=EMBEDDING_BACKENDS, batch_size=64, k=10):
+    """
+    compare the speed and quality of the embedding backends on a fixed sample, torch (full precision) is the
+    reference. Quality is the mean cosine similarity of each vector to its full precision version and the overlap of
+    the k nearest neighbors of every text among the sample with the full precision ones.
+    :param text_embedding_config: text_embedding_model section of the config
+    :param texts: sample of chunks, a few hundred to a few thousand
+    :param backends: backends to compare, torch is always run
+    :param k: number of neighbors for the retrieval overlap
+    :return: dict of backend: {"seconds", "chunks_per_second", "cosine", "recall_at_k"} or {"error"} if it could not
+    be loaded
+    """
+    def neighbors(embeddings):
+        similarity = embeddings @ embeddings.T
+        np.fill_diagonal(similarity, -np.inf)
+        return np.argsort(-similarity, axis=1)[:, :k]
+
+    results = {}
+    reference = None
+    for backend in ["torch"] + [backend for backend in backends if backend != "torch"]:
+        try:
+            model = load_text_embedding_model(text_embedding_config, backend=backend)
+        except Exception as e:
+            results[backend] = {"error": repr(e)}
+            continue
+        # one warm up batch so lazy initialization is not counted
+        encode_texts(model, texts[:batch_size], batch_size=batch_size)
+        start = time.perf_counter()
+        embeddings = encode_texts(model, texts, batch_size=batch_size, normalize=True)
+        seconds = time.perf_counter() - start
+        result = {"seconds": seconds, "chunks_per_second": len(texts) / seconds}
+        if reference is None:
+            reference = (embeddings, neighbors(embeddings))
+        result["cosine"] = float(np.mean(np.sum(embeddings * reference[0], axis=1)))
+        result["recall_at_k"] = float(np.mean([len(set(a) & set(b)) / k
+                                               for a, b in zip(neighbors(embeddings), reference[1])]))
+        results[backend] = result
+        del model
+    return results
+
+
+def stack_embeddings(rows):
+    """
+    stack per image token embeddings into one float32 array, colpali gives the same number of tokens for every image
+    but shorter ones are zero padded just in case
+    :param rows: list of (tokens, dim) arrays
+    :return: array of shape (images, tokens, dim)
+    """
+    if len(rows) == 0:
+        return np.zeros((0, 0, 0), dtype=np.float32)
+    embeddings = np.zeros((len(rows), max(row.shape[0] for row in rows), rows[0].shape[1]), dtype=np.float32)
+    for i, row in enumerate(rows):
+        embeddings[i, :row.shape[0]] = row
+    return embeddings
+
+
+def pool_embeddings(rows):
+    """
+    normalized mean of the token embeddings of each image
+    :param rows: list of (tokens, dim) arrays
+    :return: array of shape (images, dim)
+    """
+    if len(rows) == 0:
+        return np.zeros((0, 0), dtype=np.float32)
+    means = np.stack([np.asarray(row, dtype=np.float32).mean(axis=0) for row in rows])
+    return means / np.maximum(np.linalg.norm(means, axis=1, keepdims=True), 1e-12)
+
+
+def embed_images(processor, model, images, batch_size=4, pooled=False):
+    """
+    embed images with colpali in micro batches so papers with many figures do not run out of memory
+    :param processor: colpali processor
+    :param model: colpali model, the inputs are sent to the device the model is on
+    :param images: list of pillow images, can be empty
+    :param batch_size: images per forward pass
+    :param pooled: also return the mean of the token embeddings of each image, normalized, for cheap first pass search
+    :return: float32 array of shape (images, tokens, dim) on the cpu and if pooled an array of shape (images, dim)
+    """
+    import torch
+
+    rows = []
+    for start in range(0, len(images), batch_size):
+        batch = processor.process_images(images[start:start + batch_size]).to(model.device)
+        with torch.inference_mode():
+            rows.extend(model(**batch).float().cpu().numpy())
+    if pooled:
+        return stack_embeddings(rows), pool_embeddings(rows)
+    return stack_embeddings(rows)
+
+
+def limit_resolution(image, max_pixels=None):
+    """
+    downscale an image so it has at most max_pixels pixels, keeping the aspect ratio. The number of visual tokens
+    qwen2.5-vl uses grows with the resolution so this bounds the cost of large figures.
+    """
+    if max_pixels is None or image.width * image.height <= max_pixels:
+        return image
+    scale = (max_pixels / (image.width * image.height)) ** 0.5
+    return image.resize((max(1, int(image.width * scale)), max(1, int(image.height * scale))), Image.LANCZOS)
+
+
+def interpret_images(processor, model, images, prompt, batch_size=4, max_tokens=100, max_pixels=None):
+    """
+    generate a text description for each image with a vision language model, images are run in padded batches with
+    a single generate call per batch
+    :param processor: qwen2.5-vl processor
+    :param model: qwen2.5-vl model, the inputs are sent to the device the model is on
+    :param images: list of pillow images, can be empty
+    :param prompt: system prompt, the same one is used for all the images
+    :param batch_size: images per generate call
+    :param max_tokens: number of tokens to generate per image
+    :param max_pixels: images larger than this are downscaled before they are passed to the model
+    :return: list of strings, one per image
+    """
+    import torch
+
+    messages = [{"role": "system", "content": [{"type": "text", "text": prompt}]},
+                {"role": "user", "content": [{"type": "image"}]}]
+    # the template is the same for every image, the processor expands the image placeholder for each one
+    text = processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+    # generation continues from the end of the prompt so padding has to be on the left
+    processor.tokenizer.padding_side = "left"
+
+    interpretations = []
+    for start in range(0, len(images), batch_size):
+        batch = [limit_resolution(image.convert("RGB"), max_pixels) for image in images[start:start + batch_size]]
+        inputs = processor(text=[text] * len(batch), images=batch, padding=True, return_tensors="pt").to(model.device)
+        with torch.inference_mode():
+            generated_ids = model.generate(**inputs, max_new_tokens=max_tokens)
+        interpretations.extend(processor.batch_decode(generated_ids[:, inputs.input_ids.shape[1]:],
+                                                      skip_special_tokens=True, clean_up_tokenization_spaces=False))
+    return interpretations
+
+
+def batch_papers(papers, fields, run, prepare=None):
+    """
+    run a batched step over the items (chunks, figures, tables...) of many papers at once. The items of every source
+    field of every paper are gathered into one list, run is called once on all of them and its output is split back so
+    each paper gets the rows of its own items, in the same order
+    :param papers: list of papers
+    :param fields: list of (source, target) paper.info attribute names, target can also be a tuple of names when run
+    returns a tuple of outputs
+    :param run: takes the list of all the items and returns something that can be sliced with one row per item (an
+    array or a list) or a tuple of those
+    :param prepare: applied to each item before it is batched
+    :return: the same papers with the targets filled
+    """
+    items = []
+    spans = []
+    for paper in papers:
+        for source, target in fields:
+            values = getattr(paper.info, source) or []
+            if prepare is not None:
+                values = [prepare(value) for value in values]
+            spans.append((paper, target, len(items), len(items) + len(values)))
+            items.extend(values)
+
+    outputs = run(items)
+    for paper, target, start, end in spans:
+        if isinstance(target, str):
+            setattr(paper.info, target, outputs[start:end])
+        else:
+            for name, output in zip(target, outputs):
+                setattr(paper.info, name, output[start:end])
+    return papers
+
+
+def _as_text(interpretation):
+    # the vision language model returns a list with one string per image
+    if isinstance(interpretation, str):
+        return interpretation
+    return " ".join(interpretation)
+
+
+def _gb(value):
+    return None if value is None else int(value * 1024 ** 3)
 
-from transformers import Qwen2_5_VLForConditionalGeneration, AutoProcessor
-from qwen_vl_utils import process_vision_info
-from colpali_engine.models import ColPali, ColPaliProcessor
 
 class PaperProcessor:
     """
@@ -22,52 +556,195 @@ class PaperProcessor:
     the pipeline method is the main caller where you can specify which steps you would like to run
     all the necessary parameters are passed in a config dict so there are no hard coded values and no values to fill
     """
-    def __init__(self, config):
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    def __init__(self, config, models=None, cache=None):
+        """
+        :param config: the literature section of config.yaml
+        :param models: ModelPool to share loaded models between processors, if None one is created from the model_pool
+        section of the config
+        :param cache: ArtifactCache for the outputs of each step, if None one is created if artifact_cache.path is set
+        in the config, otherwise nothing is cached
+        """
+        self._device = None
         self.config=config
+        if models is None:
+            pool_config = self.config.get("model_pool", {})
+            models = ModelPool(max_ram=_gb(pool_config.get("max_ram_gb")), max_vram=_gb(pool_config.get("max_vram_gb")))
+        self.models = models
+        cache_config = self.config.get("artifact_cache") or {}
+        if cache is None and cache_config.get("path") is not None:
+            cache = ArtifactCache(cache_config["path"], max_size=cache_config.get("max_size", 10 * 1024 ** 3))
+        self.cache = cache
+        self.failed = {}
+
+    @property
+    def device(self):
+        # torch is only imported when a model is loaded
+        if self._device is None:
+            import torch
+            self._device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        return self._device
+
+    def _workers(self):
+        """
+        number of extraction processes, extraction.workers in the config or the number of cores if it is left empty
+        """
+        return (self.config.get("extraction") or {}).get("workers") or os.cpu_count()
+
+    def _page_options(self, zoom, text_strategy):
+        extraction_config = self.config.get("extraction") or {}
+        if text_strategy is None:
+            text_strategy = extraction_config.get("text_strategy", "auto")
+        return {"zoom": zoom, "text_strategy": text_strategy,
+                "layout_zoom": extraction_config.get("layout_zoom", zoom),
+                "batch_size": extraction_config.get("layout_batch_size", 8),
+                "crop_dpi": extraction_config.get("crop_dpi"),
+                "min_chars": extraction_config.get("min_chars", 50),
+                "min_image_area": extraction_config.get("min_image_area", 0.1)}
 
     # pass a list of files
-    def extract(self, model, file_path, zoom=2):
+    def extract(self, model, file_path, zoom=2, text_strategy=None):
         """
         extract text and images from a pdf, this model gets all the figures and tables from the pdf and returns them as images
-        as well as extracting the pdf text using tesseract.
-        :param file_path: pdf file path
+        as well as extracting the pdf text from the text layer of the pdf and/or using tesseract.
+        :param file_path: pdf file path, pdf bytes or an already opened pymupdf document (see literature.utils.iter_archive_documents)
+        :param text_strategy: native, ocr or auto, see extract_page, defaults to extraction.text_strategy in the config or auto
         :return: text, figures and tables as pillow images
         """
-        doc = pymupdf.open(file_path)
-        zoom_x = zoom  # horizontal zoom
-        zoom_y = zoom  # vertical zoom/
-        mat = pymupdf.Matrix(zoom_x, zoom_y)
-        texts = []
-        figures = []
-        tables = []
-        for page in doc:
-            pix = page.get_pixmap(matrix=mat)
-            pix = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-            layout = model.detect(pix)
-            figure_blocks = lp.Layout([b for b in layout if b.type == 'Figure'])
-            table_blocks = lp.Layout([b for b in layout if b.type == 'Table'])
-            if len(figure_blocks) > 0:
-                for block in figure_blocks:
-                    coords = block.block
-                    coords = (coords.x_1, coords.y_1, coords.x_2, coords.y_2,)
-                    figure_img = pix.crop(coords)
-                    figures.append(figure_img)
-
-            if len(table_blocks) > 0:
-                for block in table_blocks:
-                    coords = block.block
-                    coords = (coords.x_1, coords.y_1, coords.x_2, coords.y_2,)
-                    table_img = pix.crop(coords)
-                    tables.append(table_img)
-
-            page_text = pytesseract.image_to_string(pix)
-            texts.append(page_text)
-        texts = [text.replace("\n", " ").replace("  ", " ") for text in texts]
-        article_text = " ".join(texts)
-
-        return article_text, tables, figures
+        return self.extract_many(model, [file_path], zoom=zoom, text_strategy=text_strategy)[0]
+
+    def extract_many(self, model, file_paths, zoom=2, text_strategy=None):
+        """
+        extract for many papers in the main process, pages of consecutive papers share layout detection batches
+        :param file_paths: list of pdf file paths, pdf bytes or pymupdf documents
+        :return: list of (text, tables, figures) in the same order as the file paths
+        """
+        options = self._page_options(zoom, text_strategy)
+        pages = ((i, page) for i, file_path in enumerate(file_paths) for page in open_document(file_path))
+        results = [([], [], []) for _ in file_paths]
+        for i, page_text, page_tables, page_figures in extract_pages(model, pages, **options):
+            results[i][0].append(page_text)
+            results[i][1].extend(page_tables)
+            results[i][2].extend(page_figures)
+        return [(join_pages(texts), tables, figures) for texts, tables, figures in results]
+
+    def extract_parallel(self, file_paths, workers=None, pages_per_task=None, zoom=2, text_strategy=None):
+        """
+        parallel version of extract for many papers, pages of all the papers are spread over a process pool where each
+        worker loads its own layout model, the results are put back together in page order
+        :param file_paths: list of pdf file paths, pdf bytes or open documents, the workers are only sent the path
+        :param workers: number of processes, defaults to extraction.workers in the config, see _workers
+        :param pages_per_task: pages sent to a worker at once, defaults to extraction.pages_per_task in the config or 4
+        :param zoom: render zoom
+        :param text_strategy: native, ocr or auto, see extract
+        :return: list of (text, tables, figures) in the same order as the file paths
+        """
+        options = self._page_options(zoom, text_strategy)
+        if workers is None:
+            workers = self._workers()
+        if pages_per_task is None:
+            pages_per_task = (self.config.get("extraction") or {}).get("pages_per_task") or 4
+
+        # spawn so the workers do not inherit a cuda context or the parent's threads
+        context = multiprocessing.get_context("spawn")
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                    initargs=(self.config["lp_model"],)) as executor:
+            # every task opens the pdf from its path instead of getting a pickled copy of it, pdfs that are only in
+            # memory are written to a temporary file once
+            sources = []
+            for i, file_path in enumerate(file_paths):
+                if isinstance(file_path, pymupdf.Document):
+                    file_path = file_path.tobytes()
+                if isinstance(file_path, (bytes, bytearray)):
+                    path = os.path.join(temp_dir, "{}.pdf".format(i))
+                    with open(path, "wb") as f:
+                        f.write(file_path)
+                    file_path = path
+                sources.append(file_path)
+
+            futures = []
+            for i, source in enumerate(sources):
+                with open_document(source) as doc:
+                    page_count = len(doc)
+                for start in range(0, page_count, pages_per_task):
+                    pages = list(range(start, min(start + pages_per_task, page_count)))
+                    futures.append((i, executor.submit(_extract_pages, source, pages, options)))
+
+            pages = [[] for _ in sources]
+            for i, future in futures:
+                pages[i].extend(future.result())
+
+        results = []
+        for paper_pages in pages:
+            paper_pages.sort(key=lambda item: item[0])
+            texts = [item[1] for item in paper_pages]
+            tables = [table for item in paper_pages for table in item[2]]
+            figures = [figure for item in paper_pages for figure in item[3]]
+            results.append((join_pages(texts), tables, figures))
+        return results
+
+    def _cached_extraction(self, model_id, digest):
+        cached = self.cache.get_texts("extraction", model_id, [digest])[0]
+        if cached is None:
+            return None
+        cached = json.loads(cached)
+        images = {}
+        for name in ("tables", "figures"):
+            arrays = self.cache.get_arrays("extraction_image", model_id,
+                                           ["{}:{}:{}".format(digest, name, i) for i in range(cached[name])])
+            if any(array is None for array in arrays):
+                return None
+            images[name] = [Image.fromarray(np.array(array)) for array in arrays]
+        return cached["text"], images["tables"], images["figures"]
+
+    def _cache_extraction(self, model_id, digest, result):
+        text, tables, figures = result
+        for name, images in (("tables", tables), ("figures", figures)):
+            for i, image in enumerate(images):
+                self.cache.set_arrays("extraction_image", model_id, ["{}:{}:{}".format(digest, name, i)],
+                                      np.asarray(image)[None])
+        self.cache.set_texts("extraction", model_id, [digest],
+                             [json.dumps({"text": text, "tables": len(tables), "figures": len(figures)})])
+        return None
+
+    def extract_papers(self, papers, model=None):
+        """
+        extract the text, tables and figures of the papers into paper.info, pdfs that are in the cache are not
+        extracted again. Without a model and with more than one extraction worker in the config the pages are extracted
+        with extract_parallel
+        :param papers: list of papers with info.file_path set (a path, pdf bytes or a pymupdf document)
+        :param model: layout model, if None it is taken from the model pool
+        :return: the same papers
+        """
+        file_paths = [paper.info.file_path for paper in papers]
+        results = [None] * len(papers)
+        digests = [None] * len(papers)
+        model_id = [self.config["lp_model"], self._page_options(2, None)]
+        if self.cache is not None:
+            for i, file_path in enumerate(file_paths):
+                if isinstance(file_path, str):
+                    digests[i] = file_hash(file_path)
+                elif isinstance(file_path, (bytes, bytearray)):
+                    digests[i] = content_hash(file_path)
+                if digests[i] is not None:
+                    results[i] = self._cached_extraction(model_id, digests[i])
+
+        missing = [i for i, result in enumerate(results) if result is None]
+        if len(missing) > 0:
+            if model is None and self._workers() > 1:
+                extracted = self.extract_parallel([file_paths[i] for i in missing])
+            else:
+                if model is None:
+                    model = self.load_layout_model()
+                extracted = self.extract_many(model, [file_paths[i] for i in missing])
+            for i, result in zip(missing, extracted):
+                results[i] = result
+                if self.cache is not None and digests[i] is not None:
+                    self._cache_extraction(model_id, digests[i], result)
 
+        for paper, (text, tables, figures) in zip(papers, results):
+            paper.info.text, paper.info.tables, paper.info.figures = text, tables, figures
+        return papers
 
     def text_embeddings(self, chunker, model, text, splitting_strategy="semantic"):
         """
@@ -85,55 +762,318 @@ class PaperProcessor:
             chunks = [text]
         else:
             raise NotImplementedError("Semantic splitting and none are the only implemented methods.")
-        embeddings = model.encode(chunks)
+        embeddings = self._encode(model, chunks)
         return chunks, embeddings
 
+    def _encode_options(self):
+        text_embedding_config = self.config["text_embedding_model"]
+        return {"batch_size": text_embedding_config.get("batch_size", 64),
+                "dtype": text_embedding_config.get("dtype", "float32"),
+                "normalize": text_embedding_config.get("normalize", False)}
+
+    def _encode(self, model, texts):
+        """
+        encode_texts with the options from the config, texts that are in the cache are not embedded again
+        """
+        options = self._encode_options()
+        if self.cache is None:
+            return encode_texts(model, texts, **options)
+        # quantized backends and exported files (file_name) give slightly different vectors so they are cached separately
+        text_embedding_config = self.config["text_embedding_model"]
+        model_id = [text_embedding_config["name"], text_embedding_config.get("config"),
+                    text_embedding_config.get("backend"), text_embedding_config.get("file_name"), options["dtype"],
+                    options["normalize"], self.device.type]
+        digests = [content_hash(text) for text in texts]
+        cached = self.cache.get_arrays("text_embedding", model_id, digests)
+        missing = [i for i, item in enumerate(cached) if item is None]
+        embeddings = np.zeros((len(texts), model.get_sentence_embedding_dimension()), dtype=options["dtype"])
+        if len(missing) > 0:
+            fresh = encode_texts(model, [texts[i] for i in missing], **options)
+            self.cache.set_arrays("text_embedding", model_id, [digests[i] for i in missing], fresh)
+            embeddings[missing] = fresh
+        for i, item in enumerate(cached):
+            if item is not None:
+                embeddings[i] = item
+        return embeddings
+
+    def _chunk(self, chunker, text):
+        if self.cache is None:
+            return list(chunker.chunk(text))
+        model_id = self.config["chunker_model"]
+        digest = content_hash(text)
+        cached = self.cache.get_texts("chunks", model_id, [digest])[0]
+        if cached is not None:
+            return json.loads(cached)
+        chunks = list(chunker.chunk(text))
+        # only plain text chunks can be stored, see chunker_model.return_type
+        if all(isinstance(chunk, str) for chunk in chunks):
+            self.cache.set_texts("chunks", model_id, [digest], [json.dumps(chunks)])
+        return chunks
+
+    def embed_texts(self, model, papers, chunker=None, text=True, interpretations=False):
+        """
+        embed the texts of many papers at once, all the chunks (and figure and table interpretations) of all the papers
+        are gathered, embedded together in large batches sorted by length and the embeddings are put back in each
+        paper. This is much faster than embedding each paper on its own, especially on cpu.
+        :param model: sentence transformer
+        :param papers: list of papers with their text extracted (and images interpreted for interpretations)
+        :param chunker: chonkie semantic chunker, needed if text is True
+        :param text: chunk and embed paper.info.text
+        :param interpretations: embed the figure and table interpretations, these are not chunked
+        :return: the same papers with the embeddings filled
+        """
+        fields = []
+        if text:
+            if chunker is None:
+                raise ValueError("A chunker is needed to embed the paper text")
+            for paper in papers:
+                paper.info.text_chunks = self._chunk(chunker, paper.info.text)
+            fields.append(("text_chunks", "chunk_embeddings"))
+        if interpretations:
+            fields.append(("figure_interpretation", "figure_interpretation_embeddings"))
+            fields.append(("table_interpretation", "table_interpretation_embeddings"))
+
+        return batch_papers(papers, fields, lambda texts: self._encode(model, texts), prepare=_as_text)
+
 
     def image_embeddings(self, images, processor, model):
-        batch_images = processor.process_images(images).to(self.device)
-        with torch.no_grad():
-            image_embeddings = model(**batch_images)
+        """
+        colpali embeddings of a list of images, see embed_images
+        :return: array of shape (images, tokens, dim)
+        """
+        return self._embed_images(processor, model, images)
+
+    def _embed_images(self, processor, model, images, pooled=False):
+        """
+        embed_images with the batch size from the config, images that are in the cache are not embedded again
+        """
+        batch_size = self.config["image_embedding_model"].get("batch_size", 4)
+        if self.cache is None:
+            return embed_images(processor, model, images, batch_size=batch_size, pooled=pooled)
+        # the model config and the dtype (which depends on the device) change the vectors
+        model_config = self.config["image_embedding_model"]["model"]
+        model_id = [model_config["name"], model_config.get("config"), self.device.type]
+        digests = [content_hash(image) for image in images]
+        rows = self.cache.get_arrays("image_embedding", model_id, digests)
+        missing = [i for i, row in enumerate(rows) if row is None]
+        if len(missing) > 0:
+            fresh = embed_images(processor, model, [images[i] for i in missing], batch_size=batch_size)
+            self.cache.set_arrays("image_embedding", model_id, [digests[i] for i in missing], fresh)
+            for i, row in zip(missing, fresh):
+                rows[i] = row
+        if pooled:
+            return stack_embeddings(rows), pool_embeddings(rows)
+        return stack_embeddings(rows)
 
-        ems = []
-        for i in range(image_embeddings.shape[0]):
-            ems.append(image_embeddings[i, :, :])
-        return ems
+    def embed_figures(self, processor, model, papers, pooled=None):
+        """
+        embed the figures and tables of many papers, the images of all the papers go through the model in micro
+        batches of image_embedding_model.batch_size and are put back in each paper as one array per paper
+        :param papers: list of papers with their figures and tables extracted
+        :param pooled: also fill figure_pooled_embeddings and table_pooled_embeddings, defaults to
+        image_embedding_model.pooled in the config
+        :return: the same papers with the embeddings filled
+        """
+        image_embedding_config = self.config["image_embedding_model"]
+        if pooled is None:
+            pooled = image_embedding_config.get("pooled", False)
+        for source, target in (("figures", "figure"), ("tables", "table")):
+            targets = (target + "_embeddings", target + "_pooled_embeddings") if pooled else target + "_embeddings"
+            batch_papers(papers, [(source, targets)],
+                         lambda images: self._embed_images(processor, model, images, pooled=pooled))
+        return papers
 
     def interpret_image(self, image, prompt, model, processor, max_tokens=100):
         """
         This function takes an image and a prompt, and generates a text description of the image using a vision-language model.
-        the default model is Qwen2_5_VL.
+        the default model is Qwen2_5_VL. To interpret many images use interpret_images or interpret_figures, they are
+        much faster
         :param image: PIL image, no need to save to disk
         :param prompt: image prompt, see configs for default
         :param processor: processor class from huggingface
         :param model: model class from huggingface
         :param max_tokens: number of tokens to generate, more tokens = more text but does not mean more information
-        :param device: gpu or cpu, if cpu keep it short
         :return: string
         """
-        messages = [{"role": "system", "content": [{"type": "text",
-                                                    "text": prompt}]},
-                    {"role": "user", "content": [{"type": "image", "image": image, }], }]
-
-        text = processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-        # this is here for compatibility I will not be processing videos
-        image_inputs, video_inputs = process_vision_info(messages)
-        inputs = processor(
-            text=[text],
-            images=image_inputs,
-            videos=video_inputs,
-            padding=True,
-            return_tensors="pt",
-        )
-        inputs = inputs.to(self.device)
-        generated_ids = model.generate(**inputs, max_new_tokens=max_tokens)
-        generated_ids_trimmed = [out_ids[len(in_ids):] for in_ids,
-        out_ids in zip(inputs.input_ids, generated_ids)]
-        output_text = processor.batch_decode(
-            generated_ids_trimmed, skip_special_tokens=True, clean_up_tokenization_spaces=False)
-        return output_text
-
-    def pipeline(self, papers, extract=True, embed_text=True, embed_images=True, interpret_images=False, embed_iterpretations=False):
+        return interpret_images(processor, model, [image], prompt, max_tokens=max_tokens,
+                                max_pixels=self.config["vl_model"].get("max_pixels"))[0]
+
+    # models are loaded through the pool so they stay loaded between calls, the pool decides when to unload them
+    def load_layout_model(self):
+        return self.models.get("lp_model", self.config["lp_model"], lambda: load_layout_model(self.config["lp_model"]))
+
+    def load_chunker(self):
+        chunker_config = self.config["chunker_model"]
+
+        def load():
+            from chonkie import SemanticChunker, Model2VecEmbeddings
+            chunker_model = Model2VecEmbeddings(chunker_config["model"])
+            return SemanticChunker(
+                embedding_model=chunker_model,
+                threshold=chunker_config["threshold"],
+                chunk_size=chunker_config["chunk_size"],
+                min_sentences=chunker_config["min_sentences"],
+                return_type=chunker_config["return_type"]
+            )
+        return self.models.get("chunker_model", chunker_config, load)
+
+    def load_text_embedding_model(self):
+        text_embedding_config = self.config["text_embedding_model"]
+
+        # batch size and output options do not change the model
+        key = {field: text_embedding_config.get(field) for field in ("name", "config", "backend", "file_name")}
+        return self.models.get("text_embedding_model", key,
+                               lambda: load_text_embedding_model(text_embedding_config))
+
+    def load_image_embedding_model(self):
+        """
+        :return: colpali processor and model
+        """
+        image_embedding_config = self.config["image_embedding_model"]
+
+        def load():
+            import torch
+            from colpali_engine.models import ColPali, ColPaliProcessor
+            image_embedding_model_kwargs = image_embedding_config["model"].get("config") or {}
+            model = ColPali.from_pretrained(image_embedding_config["model"]["name"],
+                                            **image_embedding_model_kwargs,
+                                            # bfloat16 is slow or not supported on most cpus
+                                            torch_dtype=torch.bfloat16 if self.device.type == "cuda" else torch.float32,
+                                            device_map=self.device
+                                            ).eval()
+            image_embedding_processor_kwargs = image_embedding_config["processor"].get("config") or {}
+            processor = ColPaliProcessor.from_pretrained(image_embedding_config["processor"]["name"],
+                                                         **image_embedding_processor_kwargs, )
+            return processor, model
+        return self.models.get("image_embedding_model", {"model": image_embedding_config["model"],
+                                                         "processor": image_embedding_config["processor"]}, load)
+
+    def load_vl_model(self):
+        """
+        :return: vision language processor and model
+        """
+        vl_config = self.config["vl_model"]
+
+        def load():
+            from transformers import Qwen2_5_VLForConditionalGeneration, AutoProcessor
+            vl_model_kwargs = vl_config["model"].get("config") or {}
+            model = Qwen2_5_VLForConditionalGeneration.from_pretrained(vl_config["model"]["name"],
+                                                                       **vl_model_kwargs,
+                                                                       device_map=self.device)
+            vl_processor_kwargs = vl_config["processor"].get("config") or {}
+            processor = AutoProcessor.from_pretrained(vl_config["processor"]["name"], **vl_processor_kwargs)
+            return processor, model
+        # prompts do not change the model
+        return self.models.get("vl_model", {"model": vl_config["model"], "processor": vl_config["processor"]}, load)
+
+    # these run a single step for a single paper, pipeline runs them over all the papers one step at a time and
+    # pipeline_stream runs the steps at the same time with the papers flowing between them
+    def extract_paper(self, model, paper):
+        return self.extract_papers([paper], model=model)[0]
+
+    def embed_paper_text(self, chunker, model, paper):
+        self.embed_texts(model, [paper], chunker=chunker)
+        return paper
+
+    def _interpret(self, processor, model, images, prompt):
+        """
+        interpret_images with the settings from the config, images that are in the cache are not interpreted again
+        """
+        vl_config = self.config["vl_model"]
+        options = {"batch_size": vl_config.get("batch_size", 4), "max_tokens": vl_config.get("max_tokens", 100),
+                   "max_pixels": vl_config.get("max_pixels")}
+        if self.cache is None:
+            return interpret_images(processor, model, images, prompt, **options)
+        model_id = [vl_config["model"], vl_config["processor"], prompt, options["max_tokens"], options["max_pixels"],
+                    self.device.type]
+        digests = [content_hash(image) for image in images]
+        interpretations = self.cache.get_texts("interpretation", model_id, digests)
+        missing = [i for i, item in enumerate(interpretations) if item is None]
+        if len(missing) > 0:
+            fresh = interpret_images(processor, model, [images[i] for i in missing], prompt, **options)
+            self.cache.set_texts("interpretation", model_id, [digests[i] for i in missing], fresh)
+            for i, item in zip(missing, fresh):
+                interpretations[i] = item
+        return interpretations
+
+    def interpret_figures(self, processor, model, papers):
+        """
+        interpret the figures and tables of many papers, figures and tables are batched separately because they have
+        different prompts. batch_size, max_tokens and max_pixels are read from the vl_model section of the config
+        :param papers: list of papers with their figures and tables extracted
+        :return: the same papers with figure_interpretation and table_interpretation filled
+        """
+        vl_config = self.config["vl_model"]
+        for source, target, prompt in (("figures", "figure_interpretation", vl_config["figure_prompt"]),
+                                       ("tables", "table_interpretation", vl_config["table_prompt"])):
+            batch_papers(papers, [(source, target)],
+                         lambda images: self._interpret(processor, model, images, prompt))
+        return papers
+
+    def embed_paper_interpretations(self, model, paper):
+        # figure and table interpretations are not chunked, they are embeeded as is, this
+        # is not the best but also not that important since the image is embeeded as well and the full text is
+        # chunked and embeded
+        self.embed_texts(model, [paper], text=False, interpretations=True)
+        return paper
+
+    def score_texts(self, target, texts, chunk=True):
+        """
+        relevance of many texts (abstracts) to a target (the project description), see literature.utils.text_score
+        :param chunk: semantically chunk the texts, if False each text is embedded as a whole which is faster
+        :return: list of floats in the same order as the texts
+        """
+        return text_score(target, texts, self.load_text_embedding_model(),
+                          chunker=self.load_chunker() if chunk else None,
+                          batch_size=self.config["text_embedding_model"].get("batch_size", 64))
+
+    def _run_isolated(self, stage, run, papers, checkpoint, key=None):
+        """
+        run a step on a chunk of papers at once, if that fails run it paper by paper so one bad paper (a corrupt pdf,
+        an out of memory error on a huge figure) does not take the rest of the chunk down with it. The papers are
+        saved as soon as the chunk is done
+        :param key: stage_key of the step, saved with the output
+        """
+        try:
+            run(papers)
+            done = papers
+        except Exception as e:
+            if len(papers) == 1:
+                done = []
+                self.failed[paper_key(papers[0])] = {"stage": stage, "error": repr(e)}
+                checkpoint.fail(papers[0], stage, e)
+            else:
+                empty_cuda_cache()
+                done = []
+                for paper in papers:
+                    try:
+                        run([paper])
+                        done.append(paper)
+                    except Exception as e:
+                        empty_cuda_cache()
+                        self.failed[paper_key(paper)] = {"stage": stage, "error": repr(e)}
+                        checkpoint.fail(paper, stage, e)
+        for paper in done:
+            checkpoint.save(paper, stage, key)
+        return None
+
+    def _stage_settings(self, stage):
+        """
+        the parts of the config a pipeline step depends on, a checkpoint made with different settings is not used
+        """
+        if stage == "extract":
+            return [self.config.get("lp_model"), self._page_options(2, None)]
+        elif stage == "embed_text":
+            return [self.config.get("text_embedding_model"), self.config.get("chunker_model")]
+        elif stage == "embed_images":
+            return self.config.get("image_embedding_model")
+        elif stage == "interpret_images":
+            return self.config.get("vl_model")
+        else:
+            return self.config.get("text_embedding_model")
+
+    def pipeline(self, papers, extract=True, embed_text=True, embed_images=True, interpret_images=False, embed_iterpretations=False,
+                 checkpoint_dir=None, checkpoint_every=None):
         """
         whole paper processing pipeline
         :param papers: list of papers see literature.paper for details
@@ -142,112 +1082,172 @@ class PaperProcessor:
         :param embed_images: embed images
         :param interpret_images: run a vision language model on the images to generate text
         :param embed_iterpretations: embed the interpretations of the images
+        :param checkpoint_dir: if given the output of every step is saved per paper in this folder and steps that are
+        already done are loaded instead of run again, so a crashed run can be restarted with the same arguments. A step
+        is run again if its part of the config changed and so is every step after it that uses its output. Papers
+        that fail a step are skipped for the rest of the steps instead of stopping the whole batch, the reasons are in
+        self.failed
+        :param checkpoint_every: with checkpoint_dir each step is run over chunks of this many papers and every chunk is
+        saved when it is done, so a crash only loses the chunk it happened in and a failing paper only makes its own
+        chunk run again paper by paper. Defaults to pipeline.checkpoint_every in the config or 16
         :return: paper class instance with all the attributes filled
         """
-        if extract:
-            model = lp.Detectron2LayoutModel(   model_path=self.config["lp_model"]["model_path"],
-                                            config_path=self.config["lp_model"]["config_path"],
-                                            label_map={0: "Text", 1: "Title", 2: "List", 3: "Table", 4: "Figure"},
-                                            extra_config=["MODEL.ROI_HEADS.SCORE_THRESH_TEST", 0.8],
-                                                )
-            for paper in papers:
-                paper.info.text, paper.info.tables, paper.info.figures = self.extract(model, paper.info.file_path)
-        else:
+        if not extract:
             raise NotImplementedError("Extract must be true otherwise there is no data to process")
+        if embed_iterpretations and not interpret_images:
+            raise ValueError("If you want to embed interpretations you must also interpret images")
 
+        stages = [("extract", self.extract_papers)]
         if embed_text:
-            chunker_model = Model2VecEmbeddings(self.config["chunker_model"]["model"])
-            chunker = SemanticChunker(
-                embedding_model=chunker_model,
-                threshold=self.config["chunker_model"]["threshold"],
-                chunk_size=self.config["chunker_model"]["chunk_size"],
-                min_sentences=self.config["chunker_model"]["min_sentences"],
-                return_type=self.config["chunker_model"]["return_type"]
-            )
-
-            if "config" in self.config["text_embedding_model"].keys():
-                text_embedding_kwargs = self.config["text_embedding_model"]["config"]
-
-            model = SentenceTransformer(self.config["text_embedding_model"]["name"],
-                                                            **text_embedding_kwargs)
-            for paper in papers:
-                paper.info.text_chunks, paper.info.chunk_embeddings = self.text_embeddings(chunker, model, paper.info.text, splitting_strategy="semantic")
-
-
+            stages.append(("embed_text", lambda batch: self.embed_texts(self.load_text_embedding_model(), batch,
+                                                                        chunker=self.load_chunker())))
         if embed_images:
-            if "config" in self.config["image_embedding_model"]["model"].keys():
-                image_embedding_model_kwargs = self.config["image_embedding_model"]["model"]["config"]
+            stages.append(("embed_images", lambda batch: self.embed_figures(*self.load_image_embedding_model(), batch)))
+        if interpret_images:
+            stages.append(("interpret_images", lambda batch: self.interpret_figures(*self.load_vl_model(), batch)))
+        if embed_iterpretations:
+            # this is the same model as the text embedding step, the pool only reloads it if it was evicted
+            stages.append(("embed_interpretations",
+                           lambda batch: self.embed_texts(self.load_text_embedding_model(), batch, text=False,
+                                                          interpretations=True)))
 
-            model = ColPali.from_pretrained(self.config["image_embedding_model"]["model"]["name"],
-                                                                 **image_embedding_model_kwargs,
-                                                                 torch_dtype=torch.bfloat16,
-                                                                 device_map=self.device
-                                                                 ).eval()
+        if checkpoint_dir is None:
+            for _, run in stages:
+                run(papers)
+            return papers
 
-            if "config" in self.config["image_embedding_model"]["processor"].keys():
-                image_embedding_processor_kwargs = self.config["image_embedding_model"]["processor"]["config"]
+        if checkpoint_every is None:
+            checkpoint_every = self.config.get("pipeline", {}).get("checkpoint_every") or 16
+        checkpoint = PaperCheckpoint(checkpoint_dir)
+        self.failed = {}
+        keys = {}
+        for stage, run in stages:
+            keys[stage] = stage_key(self._stage_settings(stage), keys.get(STAGE_UPSTREAM.get(stage)))
+            todo = [paper for paper in papers
+                    if paper_key(paper) not in self.failed and not checkpoint.restore(paper, stage, keys[stage])]
+            for start in range(0, len(todo), checkpoint_every):
+                self._run_isolated(stage, run, todo[start:start + checkpoint_every], checkpoint, keys[stage])
+        for key, reason in self.failed.items():
+            warnings.warn("Could not process {}, {} failed: {}".format(key, reason["stage"], reason["error"]))
+        return papers
 
-            processor = ColPaliProcessor.from_pretrained(
-                self.config["image_embedding_model"]["processor"]["name"],
-                **image_embedding_processor_kwargs, )
+    def _stage(self, load, run, inbox, outbox, stop):
+        """
+        one step of pipeline_stream, runs in its own thread. papers are taken from inbox, processed and put in outbox,
+        errors are passed downstream and the rest of the inbox is drained so the upstream steps do not block. The
+        thread returns as soon as stop is set
+        """
+        try:
+            models = load()
+            while True:
+                item = _get(inbox, stop)
+                if item is _STOP or isinstance(item, _StageError):
+                    _put(outbox, item, stop)
+                    return None
+                if not _put(outbox, run(*models, item), stop):
+                    return None
+        except BaseException as e:
+            _put(outbox, _StageError(e), stop)
+            while True:
+                item = _get(inbox, stop)
+                if item is _STOP or isinstance(item, _StageError):
+                    return None
 
-            for paper in papers:
-                paper.info.figure_embeddings = self.image_embeddings(paper.info.figures, processor, model)
-                paper.info.table_embeddings = self.image_embeddings(paper.info.tables, processor, model)
+    def pipeline_stream(self, papers, extract=True, embed_text=True, embed_images=True, interpret_images=False,
+                        embed_iterpretations=False, queue_size=None):
+        """
+        streaming version of pipeline, every step runs in its own thread and the papers flow between them through
+        bounded queues so the extraction of one paper overlaps with the embedding of the previous ones. Papers are
+        yielded as soon as they are done, if you do not keep them around (for example write them to the knowledgebase
+        with project.to_kb and drop them) memory depends on the queue size and not on the number of papers.
+        Unlike pipeline all the models for the selected steps are loaded at the same time.
+        :param papers: iterable of papers, can be a generator
+        :param queue_size: papers waiting between two steps, defaults to pipeline.queue_size in the config or 2
+        :return: generator of processed papers, in the same order as the input
+        """
+        if not extract:
+            raise NotImplementedError("Extract must be true otherwise there is no data to process")
+        if embed_iterpretations and not interpret_images:
+            raise ValueError("If you want to embed interpretations you must also interpret images")
+        if queue_size is None:
+            queue_size = self.config.get("pipeline", {}).get("queue_size", 2)
 
+        stages = [(lambda: (self.load_layout_model(),), self.extract_paper)]
+        if embed_text:
+            stages.append((lambda: (self.load_chunker(), self.load_text_embedding_model()), self.embed_paper_text))
+        if embed_images:
+            stages.append((self.load_image_embedding_model,
+                           lambda processor, model, paper: self.embed_figures(processor, model, [paper])[0]))
         if interpret_images:
-            if "config" in self.config["vl_model"]["model"].keys():
-                vl_model_kwargs = self.config["vl_model"]["model"]["config"]
+            stages.append((self.load_vl_model,
+                           lambda processor, model, paper: self.interpret_figures(processor, model, [paper])[0]))
+        if embed_iterpretations:
+            stages.append((lambda: (self.load_text_embedding_model(),), self.embed_paper_interpretations))
 
-            model = Qwen2_5_VLForConditionalGeneration.from_pretrained(self.config["vl_model"]["model"]["name"],
-                                                                        **vl_model_kwargs,
-                                                                       device_map=self.device)
+        queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+        # set when the caller stops reading (closes the generator, breaks out of the loop or gets an error) so the
+        # threads return instead of waiting on a full queue forever with the models and papers still referenced
+        stop = threading.Event()
+        threads = [threading.Thread(target=self._stage, args=(load, run, queues[i], queues[i + 1], stop), daemon=True)
+                   for i, (load, run) in enumerate(stages)]
 
-            if "config" in self.config["vl_model"]["processor"].keys():
-                vl_processor_kwargs = self.config["vl_model"]["processor"]["config"]
+        def feed():
+            # papers can be a lazy iterator (iter_papers) that fails half way, the error is sent down the queues like a
+            # stage error so it reaches the caller instead of leaving it waiting forever
+            try:
+                for paper in papers:
+                    if not _put(queues[0], paper, stop):
+                        return None
+            except BaseException as e:
+                _put(queues[0], _StageError(e), stop)
+                return None
+            _put(queues[0], _STOP, stop)
 
-            processor = AutoProcessor.from_pretrained(self.config["vl_model"]["processor"]["name"],
-                                                              **vl_processor_kwargs)
+        threads.append(threading.Thread(target=feed, daemon=True))
+        for thread in threads:
+            thread.start()
 
-            for paper in papers:
-                paper.info.figure_interpretation = []
-                paper.info.table_interpretation = []
-                if len(paper.info.figures) > 0:
-                    for figure in paper.info.figures:
-                        paper.info.figure_interpretation.append(self.interpret_image(figure, self.config["vl_model"]["figure_prompt"], model, processor))
+        try:
+            while True:
+                item = queues[-1].get()
+                if item is _STOP:
+                    break
+                if isinstance(item, _StageError):
+                    raise item.error
+                yield item
+        finally:
+            stop.set()
 
-                if len(paper.info.tables) > 0:
-                    for table in paper.info.tables:
-                        paper.info.table_interpretation.append(self.interpret_image(table, self.config["vl_model"]["table_prompt"], model, processor))
 
+_STOP = object()
 
-        if embed_iterpretations:
-            if not interpret_images:
-                raise ValueError("If you want to embed interpretations you must also interpret images")
+# seconds between checks of the stop event while a pipeline_stream thread waits on a queue
+_POLL = 0.1
 
-            # ideally this would not need to re-loaded and all the models will be available all the time
-            # but this will save a substantial amount of vram at the cost of couple of seconds of load time
-            if "config" in self.config["text_embedding_model"].keys():
-                text_embedding_kwargs = self.config["text_embedding_model"]["config"]
+def _put(q, item, stop):
+    """
+    put that gives up once stop is set
+    :return: True if the item was put, False if the stream was stopped
+    """
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=_POLL)
+            return True
+        except queue.Full:
+            continue
+    return False
 
-            model = SentenceTransformer(self.config["text_embedding_model"]["name"],
-                                                            **text_embedding_kwargs)
-            # figure and paper interpretations are not chunked, they are embeeded as is, this
-            # is not the best but also not that important since the image is embeeded as well and the full text is
-            # chunked and embeded
+def _get(q, stop):
+    """
+    get that returns _STOP once stop is set
+    """
+    while not stop.is_set():
+        try:
+            return q.get(timeout=_POLL)
+        except queue.Empty:
+            continue
+    return _STOP
 
-            for paper in papers:
-                paper.info.figure_interpretation_embeddings = []
-                paper.info.table_interpretation_embeddings = []
-                if len(paper.info.figure_interpretation) > 0:
-                    for text in paper.info.figure_interpretation:
-                        paper.info.figure_interpretation_embeddings.append(
-                            self.text_embeddings(chunker=None, model=model, text=text, splitting_strategy="none")
-                        )
-
-                if len(paper.info.table_interpretation) > 0:
-                    for text in paper.table_interpretation:
-                        paper.info.table_interpretation_embeddings.append(
-                            self.text_embeddings(chunker=None, model=model, text=text, splitting_strategy="none")
-                        )
-        return papers
\ No newline at end of file
+class _StageError:
+    def __init__(self, error):
+        self.error = error
@@ -0,0 +1,135 @@
+import io
+import time
+
+from lxml import etree
+
+# streaming parsers for the pubmed efetch and arxiv atom payloads, these produce the same records as
+# parse_pubmed_article and parse_arxiv_entry in literature.py but without building the whole tree, each article is
+# cleared as soon as it is parsed so memory does not grow with the size of the response
+
+ATOM = "{http://www.w3.org/2005/Atom}"
+ARXIV = "{http://arxiv.org/schemas/atom}"
+
+
+def _source(source):
+    """
+    iterparse needs a file, responses are strings so they are wrapped, anything else is passed as is (path or file)
+    """
+    if isinstance(source, str) and source.lstrip().startswith("<"):
+        return io.BytesIO(source.encode())
+    if isinstance(source, bytes):
+        return io.BytesIO(source)
+    return source
+
+
+def _text(element):
+    if element is None:
+        return None
+    return "".join(element.itertext())
+
+
+def _clear(element):
+    element.clear()
+    # the cleared elements are still attached to the root, remove them so the tree does not grow
+    while element.getprevious() is not None:
+        del element.getparent()[0]
+
+
+def author_name(fore_name, last_name, collective_name=None):
+    """
+    "ForeName, LastName" as before, authors without a fore name (or last name) get the part that is there and
+    collective authors (consortia) get their CollectiveName
+    """
+    parts = [part for part in (fore_name, last_name) if part]
+    if len(parts) > 0:
+        return ", ".join(parts)
+    return collective_name
+
+
+def _pubmed_record(article):
+    authors = []
+    for author in article.iter("Author"):
+        affiliation_info = author.find("AffiliationInfo")
+        if affiliation_info is not None:
+            affiliation = affiliation_info.find("Affiliation")
+            authors.append({"name": author_name(_text(author.find("ForeName")), _text(author.find("LastName")),
+                                                _text(author.find("CollectiveName"))),
+                            "affiliation": _text(affiliation)})
+    doi = None
+    id_list = next(article.iter("ArticleIdList"), None)
+    if id_list is not None:
+        for item in id_list.iter("ArticleId"):
+            if item.get("IdType") == "doi":
+                doi = item.text
+                break
+    return {"id": _text(next(article.iter("PMID"))), "id_type": "pubmed",
+            "title": _text(next(article.iter("ArticleTitle"), None)),
+            "abstract": _text(next(article.iter("AbstractText"), None)),
+            "authors": authors, "doi": doi}
+
+
+def _arxiv_record(entry):
+    return {"id": entry.findtext(ATOM + "id").split("/").pop(), "id_type": "arxiv",
+            "title": entry.findtext(ATOM + "title"),
+            "abstract": entry.findtext(ATOM + "summary"),
+            "authors": [{"name": author.findtext(ATOM + "name"), "affiliation": None}
+                        for author in entry.iter(ATOM + "author")],
+            "doi": entry.findtext(ARXIV + "doi")}
+
+
+def iter_pubmed_articles(source):
+    """
+    stream the PubmedArticle elements of an efetch response
+    :param source: response text, bytes, a file path or a file object
+    :return: generator of records (dicts with id, id_type, title, abstract, authors and doi)
+    """
+    for _, article in etree.iterparse(_source(source), events=("end",), tag="PubmedArticle"):
+        yield _pubmed_record(article)
+        _clear(article)
+
+
+def iter_arxiv_entries(source):
+    """
+    stream the entry elements of an arxiv atom response
+    :param source: response text, bytes, a file path or a file object
+    :return: generator of records (dicts with id, id_type, title, abstract, authors and doi)
+    """
+    for _, entry in etree.iterparse(_source(source), events=("end",), tag=ATOM + "entry"):
+        yield _arxiv_record(entry)
+        _clear(entry)
+
+
+def benchmark_parsers(path, database="pubmed", repeat=3):
+    """
+    compare the streaming parser with the BeautifulSoup one on a recorded response, for example a 500 article efetch
+    saved with LitClient().get(EFETCH_URL, params={"db": "pubmed", "id": ",".join(ids), "retmode": "xml"})
+    :param path: recorded efetch (pubmed) or atom (arxiv) response
+    :param database: pubmed or arxiv
+    :param repeat: number of runs, the best one is reported
+    :return: dict with the number of records, the best time in seconds for each parser and whether the records match
+    """
+    from bs4 import BeautifulSoup as bs
+    from mnemosyne.literature.literature import parse_pubmed_article, parse_arxiv_entry
+
+    if database == "pubmed":
+        element, soup_parse, stream_parse = "PubmedArticle", parse_pubmed_article, iter_pubmed_articles
+    elif database == "arxiv":
+        element, soup_parse, stream_parse = "entry", parse_arxiv_entry, iter_arxiv_entries
+    else:
+        raise NotImplementedError("database must be pubmed or arxiv")
+
+    with open(path) as f:
+        text = f.read()
+
+    timings = {"bs4": [], "iterparse": []}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        soup_records = [soup_parse(item) for item in bs(text, "xml").find_all(element)]
+        timings["bs4"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        stream_records = list(stream_parse(text))
+        timings["iterparse"].append(time.perf_counter() - start)
+
+    return {"records": len(stream_records), "bs4": min(timings["bs4"]), "iterparse": min(timings["iterparse"]),
+            "speedup": min(timings["bs4"]) / min(timings["iterparse"]), "match": soup_records == stream_records}
@@ -1,36 +1,67 @@
 import os
 import warnings
 import tarfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
 
-import torch
 import json
 
 import requests
+import numpy as np
+
+from mnemosyne.literature.client import get_client
+
+def iter_archive_pdfs(file):
+    """
+    stream the pdf members of a tar, tar.gz, tar.bz2 or zip archive without extracting anything else. tar archives
+    are read sequentially so compressed archives are only decompressed once
+    :param file: path to the archive
+    :return: generator of (member name, pdf bytes)
+    """
+    if file.endswith(".zip"):
+        with zipfile.ZipFile(file) as archive:
+            for member in archive.infolist():
+                if not member.is_dir() and member.filename.lower().endswith(".pdf"):
+                    yield member.filename, archive.read(member)
+    else:
+        # r|* detects the compression and reads the archive as a stream
+        with tarfile.open(file, "r|*") as tar:
+            for member in tar:
+                if member.isfile() and member.name.lower().endswith(".pdf"):
+                    yield member.name, tar.extractfile(member).read()
+
+def iter_archive_documents(file):
+    """
+    same as iter_archive_pdfs but the bytes are opened with pymupdf directly, there are no temporary files and the
+    documents can be passed to PaperProcessor.extract
+    :return: generator of (member name, pymupdf document)
+    """
+    import pymupdf
+    for name, content in iter_archive_pdfs(file):
+        yield name, pymupdf.open(stream=content, filetype="pdf")
 
 def extract_pdfs_from_tar(file, destination):
-    """Lists the contents of a .tar.gz file.
-    Args:
-        file_path: The path to the .tar.gz file.
+    """
+    extract the pdfs in a tar, tar.gz, tar.bz2 or zip archive, the other members are not extracted
+    :param file: path to the archive
+    :param destination: folder to extract to, the paths inside the archive are kept
+    :return: list of absolute paths of the extracted pdfs, None if the archive cannot be read
     """
     if not os.path.exists(destination):
         raise FileNotFoundError("{} does not exist.".format(destination))
 
     try:
-        if file.endswith(".tar.gz"):
-            read_str="r:gz"
-        elif file.endswith(".tar.bz2"):
-            read_str="r:bz2"
-        elif file.endswith(".zip"):
-            read_str="r:zip"
-        else:
-            read_str="r"
-
         paths=[]
-        with tarfile.open(file, read_str) as tar:
-            for member in tar.getmembers():
-                if member.name.endswith("pdf"):
-                    tar.extract(member, destination)
-                    paths.append(os.path.abspath(os.path.join(destination, file, member.name)))
+        for name, content in iter_archive_pdfs(file):
+            path=os.path.abspath(os.path.join(destination, name))
+            # do not let members write outside of the destination
+            if os.path.commonpath([path, os.path.abspath(destination)]) != os.path.abspath(destination):
+                warnings.warn("Skipping {}, it is outside of the destination".format(name))
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(content)
+            paths.append(path)
 
         return paths
 
@@ -38,16 +69,35 @@ def extract_pdfs_from_tar(file, destination):
         print(f"Error: File not found: {file}")
         return None
 
-    except tarfile.ReadError:
-        print(f"Error: Could not open or read {file}. It might be corrupted or not a valid tar.gz file.")
+    except (tarfile.ReadError, zipfile.BadZipFile):
+        print(f"Error: Could not open or read {file}. It might be corrupted or not a valid archive.")
         return None
 
+def extract_pdfs_from_archives(files, destination, workers=4):
+    """
+    extract_pdfs_from_tar for many archives in parallel, each archive is handled by a separate process
+    :param files: list of archive paths
+    :param destination: folder to extract to
+    :param workers: number of processes
+    :return: dict of archive path: list of extracted pdf paths (None for archives that could not be read)
+    """
+    if not os.path.exists(destination):
+        raise FileNotFoundError("{} does not exist.".format(destination))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results=executor.map(extract_pdfs_from_tar, files, [destination] * len(files))
+        return dict(zip(files, results))
+
+# the fields we keep from openalex, these are also the only ones requested in batch lookups
+OPENALEX_FIELDS = ["id", "ids", "doi", "title", "topics", "keywords", "concepts",
+                   "mesh", "best_oa_location", "referenced_works", "related_works",
+                   "cited_by_api_url", "datasets"]
+# openalex allows up to 50 values in a single OR filter
+OPENALEX_BATCH_SIZE = 50
+
 #This is not for the end user, this is for the developers
 def filter_openalex_response(response, fields=None):
     if fields is None:
-        fields=["id", "ids", "doi", "title", "topics", "keywords", "concepts",
-                "mesh", "best_oa_location", "referenced_works", "related_works",
-                "cited_by_api_url", "datasets"]
+        fields=OPENALEX_FIELDS
     new_response = {}
     for field in fields:
         if field in response.keys():
@@ -56,7 +106,7 @@ def filter_openalex_response(response, fields=None):
 
 # the whole citeby references etc need to be removed and then re-written as a separate function
 # I give up on semantic scholar, it is unlikely I will get an api key, and openalex is good enough
-def search_openalex(id_type, paper_id, fields=None):
+def openalex_url(id_type, paper_id):
     base_url = "https://api.openalex.org/works/{}"
     if id_type == "doi":
         paper_id = f"https://doi.org/:{paper_id}"
@@ -69,16 +119,75 @@ def search_openalex(id_type, paper_id, fields=None):
     elif id_type == "openalex":
         paper_id=paper_id
 
-    url = base_url.format(paper_id)
-    response = requests.get(url)
+    return base_url.format(paper_id)
+
+def search_openalex(id_type, paper_id, fields=None, client=None):
+    url = openalex_url(id_type, paper_id)
     try:
-        response = json.loads(response.content.decode().strip())
+        response = get_client(client).get(url)
+        response = json.loads(response.strip())
         new_response = filter_openalex_response(response, fields)
     except:
         raise ValueError("Could not retrieve information for paper id {} of type {}".format(paper_id, id_type))
 
     return new_response
 
+def search_openalex_batch(openalex_ids, fields=None, client=None, batch_size=OPENALEX_BATCH_SIZE):
+    """
+    look up many openalex works with filter=openalex:W1|W2|... so each request resolves up to 50 works, only the fields
+    that are kept by filter_openalex_response are requested. Batches are sent concurrently through the client.
+    :param openalex_ids: list of openalex ids (W123...) or work urls
+    :param fields: fields to request and keep, defaults to OPENALEX_FIELDS
+    :param client: LitClient instance, if None the shared client is used
+    :param batch_size: ids per request, max 50
+    :return: list of filtered responses in the same order as the ids, None for works that were not found
+    """
+    if fields is None:
+        fields=OPENALEX_FIELDS
+    if batch_size > OPENALEX_BATCH_SIZE:
+        raise ValueError("openalex does not allow more than {} ids per filter".format(OPENALEX_BATCH_SIZE))
+    openalex_ids=[openalex_id.split("/").pop() for openalex_id in openalex_ids]
+    # id is needed to put the results back in order
+    select_fields=fields if "id" in fields else ["id"] + list(fields)
+    requests_list=[]
+    for i in range(0, len(openalex_ids), batch_size):
+        batch=openalex_ids[i:i + batch_size]
+        requests_list.append({"url": "https://api.openalex.org/works",
+                              "params": {"filter": "openalex:{}".format("|".join(batch)),
+                                         "select": ",".join(select_fields),
+                                         "per-page": len(batch)}})
+
+    responses=get_client(client).get_many(requests_list)
+    found={}
+    for response in responses:
+        if isinstance(response, Exception):
+            warnings.warn("Could not retrieve a batch of openalex works: {}".format(response))
+            continue
+        for item in json.loads(response.strip())["results"]:
+            found[item["id"].split("/").pop()]=filter_openalex_response(item, fields)
+    return [found.get(openalex_id) for openalex_id in openalex_ids]
+
+def resolve_openalex_works(links, client=None, batch_size=OPENALEX_BATCH_SIZE):
+    """
+    turn a list of openalex work urls (like referenced_works and related_works) into papers using batched lookups,
+    80 references are 2 requests instead of 80
+    :param links: list of openalex work urls
+    :param client: LitClient instance, if None the shared client is used
+    :param batch_size: ids per request, max 50
+    :return: list of papers, works that could not be found or do not have a pubmed id are skipped
+    """
+    # literature imports this module so this needs to be here
+    from mnemosyne.literature.literature import paper_from_response
+
+    responses=search_openalex_batch(links, client=client, batch_size=batch_size)
+    papers=[]
+    for link, response in zip(links, responses):
+        try:
+            papers.append(paper_from_response(response, client=client))
+        except:
+            print("Could not find a paper with id {}".format(link.split("/").pop()))
+    return papers
+
 # its here, not sure if I will use it, still waiting for an api key, feel like not gonna happen
 def search_semantic_scholar(paper_id, id_type, api_key=None, fields=None):
     base_url="https://api.semanticscholar.org/graph/v1/paper/{}?fields={}"
@@ -122,34 +231,73 @@ def search_semantic_scholar(paper_id, id_type, api_key=None, fields=None):
 def symmetric_score(sim):
     """
     get symetric score for a similarity matrix of a given text and project description
-    :param sim: pairwise similarlty matrix of semantic chunks
+    :param sim: pairwise similarlty matrix of semantic chunks, numpy array or torch tensor
     :return: float, symmetric score of mean max similarities
     """
+    sim = np.asarray(sim)
     # Mean of max similarities from rows (text1 to other)
-    mean_max_row = torch.max(sim, dim=1).values.mean().item()
+    mean_max_row = sim.max(axis=1).mean()
     # Mean of max similarities from columns (other to text1)
-    mean_max_col = torch.max(sim, dim=0).values.mean().item()
+    mean_max_col = sim.max(axis=0).mean()
     # Symmetric score
-    return (mean_max_row + mean_max_col) / 2
+    return float((mean_max_row + mean_max_col) / 2)
+
+
+def symmetric_scores(target_embeddings, embeddings, counts):
+    """
+    symmetric_score of a target against many texts at once. The chunk embeddings of all the texts are stacked into a
+    single matrix so there is one matrix product with the target, the per text maxes and means are segment reductions
+    over the rows that belong to each text.
+    :param target_embeddings: (m, dim) normalized chunk embeddings of the target
+    :param embeddings: (n, dim) normalized chunk embeddings of all the texts, the chunks of each text are consecutive
+    :param counts: number of chunks of each text, texts without chunks get a score of 0
+    :return: array with one score per text
+    """
+    counts = np.asarray(counts)
+    scores = np.zeros(len(counts), dtype=np.float32)
+    present = counts > 0
+    if not present.any() or len(target_embeddings) == 0:
+        return scores
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[present]
+    sim = np.asarray(embeddings) @ np.asarray(target_embeddings).T
+    # target to text, for each target chunk the best chunk of each text
+    target_to_text = np.maximum.reduceat(sim, starts, axis=0).mean(axis=1)
+    # text to target, for each chunk of a text the best target chunk averaged over the chunks of the text
+    text_to_target = np.add.reduceat(sim.max(axis=1), starts) / counts[present]
+    scores[present] = (target_to_text + text_to_target) / 2
+    return scores
+
 
 #TODO this might need to move to project instance because this can be used for other things like uniport description or other
 # free text that is in the other api calls.
-def text_score(self, target, query):
+def text_score(target, query, model, chunker=None, batch_size=64):
     """
     calculates a relevance score between a target text and a list of query texts, this is done by comparing
     each semantic chunk of the target to each semantic chunk of each query. for an m target chunks
-    and n query chunks we get an m x n matrix of cosine similarities. the final score is calculated by taking some measure (max)
-    for each row and then comparing the resulting vector of lenght n to all the other comparisons.
-    :param target: string
-    :param query: list of strings
+    and n query chunks we get an m x n matrix of cosine similarities. the final score is the symmetric mean of max
+    similarities (see symmetric_score). The target is embedded once and the chunks of all the queries are embedded
+    together in batches, ranking thousands of abstracts takes seconds.
+    :param target: string, usually the project description
+    :param query: list of strings, usually abstracts, None or empty strings get a score of 0
+    :param model: sentence transformer
+    :param chunker: chonkie semantic chunker, if None each text is a single chunk
+    :param batch_size: chunks per forward pass
     :return: list of floats one for each abstract in the same order as the input list
     """
-    target_chunks, target_embeddings = self.text_embeddings(target, splitting_strategy="semantic")
-    paper_scores = []
-    for item in query:
-        item_chunks, abstract_embeddings = self.text_embeddings(item, splitting_strategy="semantic")
-        sim = self.text_embedding_model.similarity(target_embeddings, item_chunks)
-        score = symmetric_score(sim)
-        paper_scores.append(score)
+    def chunk(text):
+        if text is None or len(text.strip()) == 0:
+            return []
+        if chunker is None:
+            return [text]
+        return [str(item) for item in chunker.chunk(text)]
 
-    return paper_scores
\ No newline at end of file
+    target_chunks = chunk(target)
+    chunks = [chunk(text) for text in query]
+    counts = [len(text_chunks) for text_chunks in chunks]
+    flat = [item for text_chunks in chunks for item in text_chunks]
+    if len(target_chunks) == 0 or len(flat) == 0:
+        return [0.0] * len(query)
+    target_embeddings = model.encode(target_chunks, batch_size=batch_size, normalize_embeddings=True,
+                                     convert_to_numpy=True)
+    embeddings = model.encode(flat, batch_size=batch_size, normalize_embeddings=True, convert_to_numpy=True)
+    return symmetric_scores(target_embeddings, embeddings, counts).tolist()
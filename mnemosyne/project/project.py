@@ -1,9 +1,11 @@
+import os
 from dataclasses import dataclass
 
 from sqlalchemy import select, insert
 
 from mnemosyne.knowledgebase.knowledgebase import KnowledgeBase
 from mnemosyne.literature.literature import PaperInfo, Paper, LitSearch
+from mnemosyne.literature.graph import CitationGraph
 from mnemosyne.researcher.researcher import Researcher, Manager
 
 class ProjectNameError(Exception):
@@ -77,6 +79,49 @@ class Project:
         """
         pass
 
+    def expand_literature(self, seeds, checkpoint_path=None, **kwargs):
+        """
+        snowball search from a set of seed papers, the frontier is prioritized by relevance to the project description.
+        See mnemosyne.literature.graph.CitationGraph for the budgets and other options
+        :param seeds: list of papers with openalex info or openalex ids
+        :param checkpoint_path: json file to checkpoint to, if it exists the expansion resumes from it
+        :return: CitationGraph instance
+        """
+        graph=CitationGraph(description=self.description, **kwargs)
+        if checkpoint_path is not None and os.path.exists(checkpoint_path):
+            graph.resume(checkpoint_path)
+        else:
+            graph.add_seeds(seeds)
+        return graph.expand(checkpoint_path=checkpoint_path)
+
+    def triage_literature(self, query, searcher, researchers=None, processor=None, keep=0.1, top_k=None, **kwargs):
+        """
+        two stage triage of a literature search, the results are first ranked with bm25 against the project description
+        and the interests of the researchers and only the top fraction is kept. If a processor is given the remaining
+        abstracts are then ranked by embedding similarity to the project description. Download and process only what
+        this returns.
+        :param query: search query
+        :param searcher: LitSearch instance, this is where the api key, email and http_cache come from so it is reused
+        between calls instead of creating a client every time
+        :param researchers: list of Researcher instances whose interests are used in the first stage
+        :param processor: PaperProcessor for the embedding stage, if None only the lexical stage is run
+        :param keep: fraction of the search results kept by the lexical stage
+        :param top_k: number of papers to return after the embedding stage, all of them if None
+        :param kwargs: passed to LitSearch.triage (database, max_results, min_keep, page_size)
+        :return: list of papers, most relevant first
+        """
+        targets=[self.description]
+        for researcher in researchers or []:
+            targets.extend(researcher.interests)
+        papers=[paper for paper, _ in searcher.triage(query, targets, keep=keep, **kwargs)]
+
+        if processor is not None and len(papers) > 0:
+            scores=processor.score_texts(self.description, [paper.info.abstract for paper in papers], chunk=False)
+            papers=[paper for _, paper in sorted(zip(scores, papers), key=lambda item: item[0], reverse=True)]
+        if top_k is not None:
+            papers=papers[:top_k]
+        return papers
+
     #def add_variants(self, variants):
     #    pass
 
@@ -3,7 +3,6 @@ import io
 
 from sqlalchemy import select, insert
 from PIL import Image
-import torch
 
 from mnemosyne.literature.literature import Paper, PaperInfo, LitSearch
 
@@ -8,9 +8,6 @@ import certifi
 import jsonschema
 from tqdm import tqdm
 
-from torch.cuda import is_available
-from transformers import AutoModelForCausalLM, AutoTokenizer
-
 from mnemosyne.researcher.utils import *
 
 # these are classes that represent different types of models to be served, they will all have a call method that will
@@ -19,6 +16,10 @@ from mnemosyne.researcher.utils import *
 
 class HFModel:
     def __init__(self, model_name, sys_prompt, **kwargs):
+        # torch and transformers are only needed for local models, they are slow to import
+        from torch.cuda import is_available
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
         self.model_name=model_name
         self.model = AutoModelForCausalLM.from_pretrained(self.model_name, **kwargs)
         self.tokenizer = AutoTokenizer.from_pretrained(self.model_name, **kwargs)
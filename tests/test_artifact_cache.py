@@ -0,0 +1,107 @@
+import os
+import types
+
+import numpy as np
+from PIL import Image
+
+from mnemosyne.literature import paper_processor
+from mnemosyne.literature.artifact_cache import ArtifactCache, content_hash
+from mnemosyne.literature.paper_processor import PaperProcessor
+
+
+def test_nothing_is_created_before_the_first_write(tmp_path):
+    path = tmp_path / "cache"
+    cache = ArtifactCache(str(path))
+    assert cache.get_arrays("text_embedding", "model", ["a"]) == [None]
+    assert cache.get_texts("interpretation", "model", ["a"]) == [None]
+    assert cache.stats()["entries"] == 0
+    assert not os.path.exists(path)
+
+    cache.set_arrays("text_embedding", "model", ["a", "b"], np.arange(6, dtype=np.float32).reshape(2, 3))
+    assert os.path.exists(path / "index.sqlite")
+    assert np.array_equal(cache.get_arrays("text_embedding", "model", ["b"])[0], [3, 4, 5])
+
+
+def test_default_config_does_not_cache():
+    processor = PaperProcessor({"artifact_cache": {"path": None}})
+    assert processor.cache is None
+
+
+def test_image_embeddings_are_keyed_by_model_config(tmp_path, monkeypatch):
+    calls = []
+
+    def fake_embed_images(processor, model, images, batch_size=4, pooled=False):
+        calls.append(len(images))
+        return np.ones((len(images), 2, 3), dtype=np.float32)
+
+    monkeypatch.setattr(paper_processor, "embed_images", fake_embed_images)
+    config = {"image_embedding_model": {"model": {"name": "colpali", "config": {"revision": "a"}}, "batch_size": 2}}
+    processor = PaperProcessor(config, cache=ArtifactCache(str(tmp_path)))
+    processor._device = types.SimpleNamespace(type="cpu")
+    images = [Image.new("RGB", (4, 4), color) for color in ("red", "blue")]
+
+    processor._embed_images(None, None, images)
+    processor._embed_images(None, None, images)
+    assert calls == [2]
+
+    config["image_embedding_model"]["model"]["config"] = {"revision": "b"}
+    processor._embed_images(None, None, images)
+    assert calls == [2, 2]
+
+
+class LengthModel:
+    def get_sentence_embedding_dimension(self):
+        return 1
+
+    def encode(self, texts, batch_size=None, normalize_embeddings=False, convert_to_numpy=True):
+        return np.array([[len(text)] for text in texts], dtype=np.float32)
+
+
+def test_text_embeddings_are_keyed_by_model_config(tmp_path, monkeypatch):
+    calls = []
+
+    def fake_encode_texts(model, texts, **options):
+        calls.append(len(texts))
+        return np.ones((len(texts), 1), dtype=np.float32)
+
+    monkeypatch.setattr(paper_processor, "encode_texts", fake_encode_texts)
+    config = {"text_embedding_model": {"name": "qwen", "config": {"revision": "a"}}}
+    processor = PaperProcessor(config, cache=ArtifactCache(str(tmp_path)))
+    processor._device = types.SimpleNamespace(type="cpu")
+
+    processor._encode(LengthModel(), ["a", "b"])
+    processor._encode(LengthModel(), ["a", "b"])
+    assert calls == [2]
+    config["text_embedding_model"]["config"] = {"revision": "b"}
+    processor._encode(LengthModel(), ["a", "b"])
+    config["text_embedding_model"]["file_name"] = "onnx/model_qint8.onnx"
+    processor._encode(LengthModel(), ["a", "b"])
+    assert calls == [2, 2, 2]
+
+
+def test_interpretations_are_keyed_by_model_and_processor_config(tmp_path, monkeypatch):
+    calls = []
+
+    def fake_interpret_images(processor, model, images, prompt, **options):
+        calls.append(len(images))
+        return ["interpretation" for _ in images]
+
+    monkeypatch.setattr(paper_processor, "interpret_images", fake_interpret_images)
+    config = {"vl_model": {"model": {"name": "qwen", "config": {"revision": "a"}},
+                           "processor": {"name": "qwen", "config": {}}}}
+    processor = PaperProcessor(config, cache=ArtifactCache(str(tmp_path)))
+    processor._device = types.SimpleNamespace(type="cpu")
+    images = [Image.new("RGB", (4, 4), color) for color in ("red", "blue")]
+
+    processor._interpret(None, None, images, "prompt")
+    processor._interpret(None, None, images, "prompt")
+    assert calls == [2]
+    config["vl_model"]["model"]["config"] = {"revision": "b"}
+    processor._interpret(None, None, images, "prompt")
+    config["vl_model"]["processor"]["config"] = {"min_pixels": 1024}
+    processor._interpret(None, None, images, "prompt")
+    assert calls == [2, 2, 2]
+
+
+def test_content_hash_depends_on_image_size():
+    assert content_hash(Image.new("L", (2, 3))) != content_hash(Image.new("L", (3, 2)))
@@ -0,0 +1,54 @@
+import numpy as np
+
+from mnemosyne.literature.literature import Paper
+from mnemosyne.literature.paper_processor import PaperProcessor, batch_papers
+
+
+def paper(figures, tables):
+    p = Paper("1", get_abstract=False)
+    p.info.figures, p.info.tables = figures, tables
+    return p
+
+
+def test_outputs_are_scattered_back_in_order():
+    papers = [paper(["a", "b"], ["c"]), paper(None, []), paper([], ["d", "e", "f"]), paper(["g"], None)]
+    calls = []
+
+    def run(items):
+        calls.append(items)
+        return np.array([ord(item) for item in items])
+
+    batch_papers(papers, [("figures", "figure_embeddings"), ("tables", "table_embeddings")], run,
+                 prepare=str.upper)
+    # one call with the items of all the papers, paper by paper and field by field
+    assert calls == [["A", "B", "C", "D", "E", "F", "G"]]
+    assert [list(p.info.figure_embeddings) for p in papers] == [[65, 66], [], [], [71]]
+    assert [list(p.info.table_embeddings) for p in papers] == [[67], [], [68, 69, 70], []]
+
+
+def test_tuple_outputs_fill_several_targets():
+    papers = [paper(["a"], []), paper(["b", "c"], [])]
+    batch_papers(papers, [("figures", ("figure_embeddings", "figure_pooled_embeddings"))],
+                 lambda items: (items, [item * 2 for item in items]))
+    assert [p.info.figure_embeddings for p in papers] == [["a"], ["b", "c"]]
+    assert [p.info.figure_pooled_embeddings for p in papers] == [["aa"], ["bb", "cc"]]
+
+
+class LengthModel:
+    # the embedding of a text is its length, encode_texts sorts the texts by length so this checks the unsorting too
+    def get_sentence_embedding_dimension(self):
+        return 1
+
+    def encode(self, texts, batch_size=None, normalize_embeddings=False, convert_to_numpy=True):
+        return np.array([[len(text)] for text in texts], dtype=np.float32)
+
+
+def test_embed_texts_puts_interpretation_embeddings_on_their_paper():
+    processor = PaperProcessor({"text_embedding_model": {"name": "length", "batch_size": 2}})
+    papers = [paper([], []), paper([], []), paper([], [])]
+    papers[0].info.figure_interpretation, papers[0].info.table_interpretation = ["xx", ["yyy", "y"]], []
+    papers[1].info.figure_interpretation, papers[1].info.table_interpretation = None, ["z" * 10]
+    papers[2].info.figure_interpretation, papers[2].info.table_interpretation = ["w" * 7], ["v"]
+    processor.embed_texts(LengthModel(), papers, text=False, interpretations=True)
+    assert [p.info.figure_interpretation_embeddings[:, 0].tolist() for p in papers] == [[2, 5], [], [7]]
+    assert [p.info.table_interpretation_embeddings[:, 0].tolist() for p in papers] == [[], [10], [1]]
@@ -0,0 +1,93 @@
+import pytest
+
+from mnemosyne.literature.literature import Paper
+from mnemosyne.literature.paper_processor import PaperProcessor
+
+
+class StubProcessor(PaperProcessor):
+    def __init__(self, config):
+        super().__init__(config)
+        self.runs = []
+
+    def extract_papers(self, papers, model=None):
+        self.runs.append("extract")
+        for paper in papers:
+            paper.info.text = "{} text".format(self.config["extraction"]["text_strategy"])
+            paper.info.tables, paper.info.figures = [], []
+        return papers
+
+    def load_text_embedding_model(self):
+        return None
+
+    def load_chunker(self):
+        return None
+
+    def embed_texts(self, model, papers, chunker=None, text=True, interpretations=False):
+        self.runs.append("embed_text")
+        for paper in papers:
+            paper.info.text_chunks = [paper.info.text]
+            paper.info.chunk_embeddings = None
+        return papers
+
+
+def run(tmp_path, text_strategy="native", model="small"):
+    processor = StubProcessor({"lp_model": {}, "extraction": {"text_strategy": text_strategy},
+                               "text_embedding_model": {"name": model}})
+    papers = [Paper("1", get_abstract=False)]
+    processor.pipeline(papers, embed_images=False, checkpoint_dir=str(tmp_path))
+    return processor.runs, papers[0].info.text_chunks
+
+
+def test_finished_steps_are_restored(tmp_path):
+    assert run(tmp_path) == (["extract", "embed_text"], ["native text"])
+    assert run(tmp_path) == ([], ["native text"])
+
+
+def test_changed_upstream_settings_invalidate_downstream_steps(tmp_path):
+    run(tmp_path)
+    assert run(tmp_path, text_strategy="ocr") == (["extract", "embed_text"], ["ocr text"])
+    assert run(tmp_path, text_strategy="ocr", model="large") == (["embed_text"], ["ocr text"])
+
+
+class CrashingProcessor(StubProcessor):
+    def __init__(self, config, crash_on=None, fail_on=None):
+        super().__init__(config)
+        self.crash_on = crash_on
+        self.fail_on = fail_on
+        self.batches = []
+
+    def extract_papers(self, papers, model=None):
+        self.batches.append([paper.info.id for paper in papers])
+        for paper in papers:
+            if paper.info.id == self.crash_on:
+                raise KeyboardInterrupt()
+            if paper.info.id == self.fail_on:
+                raise ValueError("corrupt pdf")
+        return super().extract_papers(papers, model)
+
+
+def test_finished_chunks_survive_a_crash(tmp_path):
+    config = {"lp_model": {}, "extraction": {"text_strategy": "native"}, "text_embedding_model": {"name": "small"}}
+    papers = [Paper(str(i), get_abstract=False) for i in range(7)]
+    processor = CrashingProcessor(config, crash_on="5")
+    with pytest.raises(KeyboardInterrupt):
+        processor.pipeline(papers, embed_text=False, embed_images=False, checkpoint_dir=str(tmp_path),
+                           checkpoint_every=2)
+    assert processor.batches == [["0", "1"], ["2", "3"], ["4", "5"]]
+
+    processor = CrashingProcessor(config)
+    processor.pipeline([Paper(str(i), get_abstract=False) for i in range(7)], embed_text=False, embed_images=False,
+                       checkpoint_dir=str(tmp_path), checkpoint_every=2)
+    assert processor.batches == [["4", "5"], ["6"]]
+
+
+def test_a_failing_paper_only_reruns_its_chunk(tmp_path):
+    config = {"lp_model": {}, "extraction": {"text_strategy": "native"}, "text_embedding_model": {"name": "small"}}
+    papers = [Paper(str(i), get_abstract=False) for i in range(6)]
+    processor = CrashingProcessor(config, fail_on="3")
+    with pytest.warns(UserWarning, match="corrupt pdf"):
+        processor.pipeline(papers, embed_text=False, embed_images=False, checkpoint_dir=str(tmp_path),
+                           checkpoint_every=2)
+    assert processor.batches == [["0", "1"], ["2", "3"], ["2"], ["3"], ["4", "5"]]
+    assert list(processor.failed) == ["pubmed_3"]
+    assert [paper.info.text for paper in papers] == ["native text"] * 3 + [None] + ["native text"] * 2
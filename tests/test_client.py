@@ -0,0 +1,65 @@
+import time
+import threading
+
+from mnemosyne.literature.client import LitClient, TokenBucket
+
+
+class FakeResponse:
+    status = 200
+
+    def raise_for_status(self):
+        return None
+
+    async def text(self):
+        return "ok"
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return None
+
+
+class FakeSession:
+    closed = False
+
+    def request(self, method, url, params=None, data=None):
+        return FakeResponse()
+
+    async def close(self):
+        return None
+
+
+class FakeClient(LitClient):
+    def _get_session(self):
+        return FakeSession()
+
+
+def test_clients_share_the_rate_limit_of_a_host():
+    # a rate no other test uses so the bucket starts full
+    rate_limits = {"eutils.ncbi.nlm.nih.gov": 25}
+    requests = [{"url": "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"}] * 5
+    with FakeClient(rate_limits=rate_limits) as first, FakeClient(rate_limits=rate_limits) as second:
+        start = time.monotonic()
+        threads = [threading.Thread(target=client.get_many, args=(requests,)) for client in (first, second)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # 10 requests at 25 per second, two separate buckets would take half as long
+        assert time.monotonic() - start >= 9 / 25 * 0.95
+
+
+def test_token_bucket_reserves_consecutive_slots():
+    bucket = TokenBucket(10)
+    delays = [bucket.reserve() for _ in range(4)]
+    assert delays[0] == 0
+    assert [round(delay, 1) for delay in delays[1:]] == [0.1, 0.2, 0.3]
+
+
+def test_client_closes_on_exit():
+    with FakeClient() as client:
+        assert client.get("https://api.openalex.org/works") == "ok"
+        thread = client._thread
+    assert client._loop is None
+    assert not thread.is_alive()
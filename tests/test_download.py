@@ -0,0 +1,38 @@
+import asyncio
+
+from mnemosyne.literature.download import DownloadManager
+from mnemosyne.literature.literature import Paper
+
+
+class FakeFetch(DownloadManager):
+    def __init__(self, destination, **kwargs):
+        super().__init__(destination, min_size=0, **kwargs)
+        self.active = {}
+        self.peak = 0
+        self.started = []
+
+    async def _fetch(self, session, url, part):
+        host = url.split("/")[2]
+        self.started.append(host)
+        self.active[host] = self.active.get(host, 0) + 1
+        self.peak = max(self.peak, sum(self.active.values()))
+        await asyncio.sleep(0.05)
+        self.active[host] -= 1
+        with open(part, "wb") as f:
+            f.write("%PDF-1.4 {}".format(url).encode())
+
+
+def test_a_busy_host_does_not_hold_the_global_slots(tmp_path):
+    papers = []
+    for i, host in enumerate(["a.org"] * 6 + ["b.org", "c.org"]):
+        paper = Paper(str(i), get_abstract=False)
+        paper.info.download_link = "https://{}/{}.pdf".format(host, i)
+        papers.append(paper)
+
+    manager = FakeFetch(str(tmp_path), max_concurrent=4, per_host=1)
+    asyncio.run(manager._download_all(papers))
+    assert manager.failed == {}
+    assert all(paper.info.downloaded for paper in papers)
+    # one a.org download plus b.org and c.org at the same time, the other hosts do not wait behind a.org
+    assert manager.peak == 3
+    assert set(manager.started[:3]) == {"a.org", "b.org", "c.org"}
@@ -0,0 +1,22 @@
+from mnemosyne.literature.literature import Paper
+from mnemosyne.literature.paper_processor import PaperProcessor
+
+class ExtractionRoute(PaperProcessor):
+    def load_layout_model(self):
+        return "layout"
+
+    def extract_many(self, model, file_paths, zoom=2, text_strategy=None):
+        return [("main", [], []) for _ in file_paths]
+
+    def extract_parallel(self, file_paths, workers=None, pages_per_task=None, zoom=2, text_strategy=None):
+        return [("parallel {}".format(self._workers()), [], []) for _ in file_paths]
+
+
+def test_empty_workers_uses_all_the_cores(monkeypatch):
+    monkeypatch.setattr("os.cpu_count", lambda: 4)
+    for extraction, text in [({"workers": None}, "parallel 4"), (None, "parallel 4"), ({"workers": 1}, "main"),
+                             ({"workers": 2}, "parallel 2")]:
+        paper = Paper("1", get_abstract=False)
+        paper.info.file_path = "paper.pdf"
+        ExtractionRoute({"lp_model": {}, "extraction": extraction}).extract_papers([paper])
+        assert paper.info.text == text
@@ -0,0 +1,62 @@
+import numpy as np
+
+from mnemosyne.literature.lexical import BM25
+from mnemosyne.literature.literature import LitSearch
+
+DOCUMENTS = [
+    "single cell sequencing of the mouse brain",
+    "protein folding with deep learning",
+    "single cell atlas of human brain development",
+    "weather forecasting",
+    None,
+]
+
+
+def test_score_many_normalizes_each_query():
+    index = BM25(DOCUMENTS)
+    queries = ["single cell brain atlas", "protein folding", "nothing matches this"]
+    scores = index.score_many(queries)
+    # each query's best document gets 1 and a document keeps its best normalized score over the queries
+    expected = np.zeros(len(DOCUMENTS), dtype=np.float32)
+    for query in queries:
+        query_scores = index.score(query)
+        if query_scores.max() > 0:
+            expected = np.maximum(expected, query_scores / query_scores.max())
+    assert np.allclose(scores, expected)
+    assert scores[1] == 1 and scores[2] == 1
+    assert 0 < scores[0] < 1
+    assert scores[3] == 0 and scores[4] == 0
+    assert (index.score_many(["nothing matches this"]) == 0).all()
+    assert (index.score_many([]) == 0).all()
+
+
+class StubSearch(LitSearch):
+    def __init__(self, records):
+        super().__init__(client=object())
+        self.records = records
+
+    def iter_records(self, query, database="pubmed", page_size=200, max_results=None):
+        return iter(self.records[:max_results])
+
+
+def records(n):
+    return [{"id": str(i), "id_type": "pubmed", "title": "paper {}".format(i),
+             "abstract": "single cell" if i % 2 == 0 else "weather", "authors": [], "doi": None} for i in range(n)]
+
+
+def test_triage_keeps_the_rounded_up_fraction_and_at_least_min_keep():
+    searcher = StubSearch(records(95))
+    # 10% of 95 is 9.5, rounded up
+    assert len(searcher.triage("q", ["single cell"], keep=0.1, min_keep=1)) == 10
+    assert len(searcher.triage("q", ["single cell"], keep=0.1, min_keep=20)) == 20
+    # min_keep never asks for more than there is
+    assert len(searcher.triage("q", ["single cell"], keep=0.1, min_keep=200)) == 95
+    assert len(searcher.triage("q", ["single cell"], keep=0.1, min_keep=1, max_results=5)) == 1
+    assert searcher.triage("q", ["single cell"], keep=0.5, min_keep=0, max_results=0) == []
+
+
+def test_triage_orders_by_score():
+    searcher = StubSearch(records(10))
+    results = searcher.triage("q", ["single cell"], keep=0.5, min_keep=0)
+    assert [paper.info.id for paper, _ in results] == ["0", "2", "4", "6", "8"]
+    assert all(score == 1 for _, score in results)
@@ -0,0 +1,153 @@
+import json
+
+import pytest
+
+from mnemosyne.literature.cache import CacheMissError, ResponseCache, cache_key
+from mnemosyne.literature.client import LitClient
+from mnemosyne.literature.literature import LitSearch, Paper
+from mnemosyne.literature.utils import OPENALEX_FIELDS
+from test_parsers import EFETCH
+
+ESEARCH = """<?xml version="1.0"?>
+<eSearchResult><Count>2</Count><RetMax>2</RetMax><IdList><Id>111</Id><Id>222</Id></IdList></eSearchResult>
+"""
+
+CITED_BY_URL = "https://api.openalex.org/works"
+CITED_BY_PARAMS = {"filter": "cites:W1", "per-page": 200, "select": ",".join(OPENALEX_FIELDS)}
+
+
+def work(pmid, title):
+    return {"id": "https://openalex.org/W{}".format(pmid),
+            "ids": {"pmid": "https://pubmed.ncbi.nlm.nih.gov/{}".format(pmid)}, "title": title,
+            "best_oa_location": {"pdf_url": "https://example.org/{}.pdf".format(pmid)}}
+
+
+def record(cache, url, params, body):
+    cache.set(cache_key(url, params=params), url, body)
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"))
+    params = {"retmode": "xml", "email": None, "api_key": None, "sort": "relevance"}
+    record(cache, "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi?db=pubmed&term=crispr&retmax=2", params,
+           ESEARCH)
+    first = {"meta": {"next_cursor": "abc"}, "results": [work(333, "First citing"), work(444, "Second citing")]}
+    last = {"meta": {"next_cursor": None}, "results": []}
+    record(cache, CITED_BY_URL, dict(CITED_BY_PARAMS, cursor="*"), json.dumps(first))
+    record(cache, CITED_BY_URL, dict(CITED_BY_PARAMS, cursor="abc"), json.dumps(last))
+    cache.close()
+    return str(tmp_path / "responses.sqlite")
+
+
+def test_search_replays_recorded_responses(cache_path):
+    # the http_cache section of config.yaml, the api key and email are not part of the key
+    searcher = LitSearch(pubmed_api_key="key", email="me@example.org", cache={"path": cache_path, "offline": True})
+    try:
+        assert searcher.search("crispr", max_results=2) == ["111", "222"]
+        with pytest.raises(CacheMissError):
+            searcher.search("crispr", max_results=3)
+    finally:
+        searcher.client.close()
+
+
+def test_cited_by_replays_recorded_responses(cache_path):
+    client = LitClient(cache=ResponseCache(cache_path, offline=True))
+    try:
+        paper = Paper("1", get_abstract=False, client=client)
+        paper.info.openalex_info = {"cited_by_api_url": "https://api.openalex.org/works?filter=cites:W1"}
+        paper.get_cited_by()
+        assert [p.info.id for p in paper.info.cited_by] == ["333", "444"]
+        assert [p.info.title for p in paper.info.cited_by] == ["First citing", "Second citing"]
+
+        paper.info.openalex_info = {"cited_by_api_url": "https://api.openalex.org/works?filter=cites:W2"}
+        with pytest.raises(CacheMissError):
+            paper.get_cited_by()
+    finally:
+        client.close()
+
+
+def test_cited_by_filters_and_stops_early(cache_path):
+    client = LitClient(cache=ResponseCache(cache_path, offline=True))
+    try:
+        paper = Paper("1", get_abstract=False, client=client)
+        paper.info.openalex_info = {"cited_by_api_url": "https://api.openalex.org/works?filter=cites:W1"}
+        assert [p.info.id for p in paper.iter_cited_by(max_results=1)] == ["333"]
+        relevant = paper.iter_cited_by(relevance=lambda item: item["title"].startswith("Second"), min_relevance=1)
+        assert [p.info.id for p in relevant] == ["444"]
+        with pytest.raises(ValueError):
+            paper.get_cited_by(relevance=lambda item: 1)
+    finally:
+        client.close()
+
+
+class FakeResponse:
+    status = 200
+
+    def __init__(self, body):
+        self.body = body
+
+    def raise_for_status(self):
+        return None
+
+    async def text(self):
+        return self.body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return None
+
+
+class FakeEutils:
+    # every search gets a new WebEnv, the pages only exist for the WebEnv they were searched with
+    def __init__(self):
+        self.closed = False
+        self.searches = 0
+        self.fetches = []
+
+    def request(self, method, url, params=None, data=None):
+        if url.endswith("esearch.fcgi"):
+            self.searches += 1
+            return FakeResponse("<eSearchResult><Count>1</Count><QueryKey>1</QueryKey><WebEnv>env{}</WebEnv>"
+                                "</eSearchResult>".format(self.searches))
+        self.fetches.append(params["WebEnv"])
+        if params["WebEnv"] != "env{}".format(self.searches):
+            return FakeResponse("<PubmedArticleSet></PubmedArticleSet>")
+        return FakeResponse(EFETCH.replace("<PMID>111</PMID>", "<PMID>{}</PMID>".format(self.searches)))
+
+
+class FakeClient(LitClient):
+    def __init__(self, **kwargs):
+        super().__init__(rate_limits={"eutils.ncbi.nlm.nih.gov": 100}, **kwargs)
+        self.server = FakeEutils()
+
+    def _get_session(self):
+        return self.server
+
+
+def test_history_server_requests_are_not_cached(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"))
+    client = FakeClient(cache=cache)
+    try:
+        searcher = LitSearch(client=client)
+        assert [record["id"] for record in searcher.iter_records("crispr")] == ["1", "222"]
+        # a rerun searches again and fetches the pages with the new WebEnv instead of replaying the expired one
+        assert [record["id"] for record in searcher.iter_records("crispr")] == ["2", "222"]
+        assert client.server.fetches == ["env1", "env2"]
+        assert cache.stats()["entries"] == 0
+    finally:
+        client.close()
+
+    offline = LitClient(cache=ResponseCache(str(tmp_path / "responses.sqlite"), offline=True))
+    try:
+        with pytest.raises(CacheMissError):
+            list(LitSearch(client=offline).iter_records("crispr"))
+    finally:
+        offline.close()
+
+
+def test_empty_path_does_not_cache():
+    assert ResponseCache.from_config({"path": None, "offline": True}) is None
+    assert ResponseCache.from_config(None) is None
@@ -0,0 +1,42 @@
+from bs4 import BeautifulSoup as bs
+
+from mnemosyne.literature.literature import parse_pubmed_article
+from mnemosyne.literature.parsers import iter_pubmed_articles
+
+EFETCH = """<?xml version="1.0"?>
+<PubmedArticleSet>
+<PubmedArticle>
+  <MedlineCitation>
+    <PMID>111</PMID>
+    <Article>
+      <ArticleTitle>A consortium paper</ArticleTitle>
+      <Abstract><AbstractText>Some abstract.</AbstractText></Abstract>
+      <AuthorList>
+        <Author><LastName>Smith</LastName><ForeName>Jane</ForeName>
+          <AffiliationInfo><Affiliation>Somewhere</Affiliation></AffiliationInfo></Author>
+        <Author><LastName>Doe</LastName>
+          <AffiliationInfo><Affiliation>Elsewhere</Affiliation></AffiliationInfo></Author>
+        <Author><CollectiveName>The Genome Consortium</CollectiveName>
+          <AffiliationInfo></AffiliationInfo></Author>
+      </AuthorList>
+    </Article>
+  </MedlineCitation>
+  <PubmedData><ArticleIdList><ArticleId IdType="doi">10.1/abc</ArticleId></ArticleIdList></PubmedData>
+</PubmedArticle>
+<PubmedArticle>
+  <MedlineCitation><PMID>222</PMID><Article><ArticleTitle>Second</ArticleTitle></Article></MedlineCitation>
+</PubmedArticle>
+</PubmedArticleSet>
+"""
+
+
+def test_missing_name_parts_and_collective_authors():
+    records = list(iter_pubmed_articles(EFETCH))
+    assert [record["id"] for record in records] == ["111", "222"]
+    assert [author["name"] for author in records[0]["authors"]] == ["Jane, Smith", "Doe", "The Genome Consortium"]
+    assert records[0]["doi"] == "10.1/abc"
+
+
+def test_streaming_parser_matches_bs4():
+    soup_records = [parse_pubmed_article(item) for item in bs(EFETCH, "xml").find_all("PubmedArticle")]
+    assert soup_records == list(iter_pubmed_articles(EFETCH))
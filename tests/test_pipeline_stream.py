@@ -0,0 +1,63 @@
+import time
+import threading
+
+import pytest
+
+from mnemosyne.literature.paper_processor import PaperProcessor
+
+
+class StubProcessor(PaperProcessor):
+    def load_layout_model(self):
+        return "layout"
+
+    def extract_paper(self, model, paper):
+        return paper * 10
+
+
+def test_stream_yields_in_order():
+    processor = StubProcessor({})
+    assert list(processor.pipeline_stream(range(5), embed_text=False, embed_images=False)) == [0, 10, 20, 30, 40]
+
+
+def test_error_in_the_input_iterator_reaches_the_caller():
+    def papers():
+        yield 1
+        raise ConnectionError("network down")
+
+    processor = StubProcessor({})
+    stream = processor.pipeline_stream(papers(), embed_text=False, embed_images=False)
+    assert next(stream) == 10
+    with pytest.raises(ConnectionError):
+        next(stream)
+
+
+def test_error_in_a_stage_reaches_the_caller():
+    class Failing(StubProcessor):
+        def extract_paper(self, model, paper):
+            if paper == 3:
+                raise ValueError("corrupt pdf")
+            return paper
+
+    with pytest.raises(ValueError):
+        list(Failing({}).pipeline_stream(range(10), embed_text=False, embed_images=False))
+
+
+def wait_for_threads(count, timeout=2):
+    deadline = time.monotonic() + timeout
+    while threading.active_count() > count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return threading.active_count()
+
+
+def test_closing_the_stream_early_stops_the_threads():
+    before = threading.active_count()
+    processor = StubProcessor({"pipeline": {"queue_size": 1}})
+    for _ in range(3):
+        stream = processor.pipeline_stream(range(100), embed_text=False, embed_images=False)
+        assert next(stream) == 0
+        stream.close()
+    assert wait_for_threads(before) == before
+
+    for paper in processor.pipeline_stream(range(100), embed_text=False, embed_images=False):
+        break
+    assert wait_for_threads(before) == before
@@ -0,0 +1,38 @@
+import numpy as np
+
+from mnemosyne.literature.utils import symmetric_score, symmetric_scores
+
+
+def normalized(rng, n, dim=8):
+    vectors = rng.normal(size=(n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def reference(target, embeddings, counts):
+    scores = []
+    start = 0
+    for count in counts:
+        chunks = embeddings[start:start + count]
+        start += count
+        scores.append(symmetric_score(chunks @ target.T) if count > 0 else 0.0)
+    return np.array(scores, dtype=np.float32)
+
+
+def test_symmetric_scores_match_the_per_text_score():
+    rng = np.random.default_rng(0)
+    # texts without chunks at the start, in the middle and at the end, single chunk texts next to them
+    counts = [0, 3, 1, 0, 0, 5, 1, 2, 0]
+    for target_chunks in [1, 4]:
+        target = normalized(rng, target_chunks)
+        embeddings = normalized(rng, sum(counts))
+        scores = symmetric_scores(target, embeddings, counts)
+        assert scores.shape == (len(counts),)
+        assert np.allclose(scores, reference(target, embeddings, counts), atol=1e-6)
+        assert (scores[np.array(counts) == 0] == 0).all()
+
+
+def test_symmetric_scores_without_chunks():
+    rng = np.random.default_rng(1)
+    assert (symmetric_scores(normalized(rng, 2), np.zeros((0, 8), dtype=np.float32), [0, 0]) == 0).all()
+    assert (symmetric_scores(np.zeros((0, 8), dtype=np.float32), normalized(rng, 3), [1, 2]) == 0).all()
+    assert len(symmetric_scores(normalized(rng, 2), np.zeros((0, 8), dtype=np.float32), [])) == 0